@@ -1,30 +1,41 @@
 #Agent.py
 
 from __future__ import absolute_import
-from config import EPSILON
+from config import EPSILON, WEIGHT_RENORM_THRESHOLD
+from sampler import FenwickSampler, LazyProbabilitySum, SparseDeltaSampler, SparseProbabilitySum
 import numpy as np
 
 
 class Agent:
-    def __init__(self, i, dow, city, alpha=0.5, car_ownership_rate=0.7):
+    def __init__(self, i, dow, city, alpha=0.5, car_ownership_rate=0.7, rng=None, candidate_sets=None, prior=None):
         self.i = i  # Agent identifier
         self.dow = dow  # Endowment
         self.city = city  # City object
         self.alpha = alpha  # Weight parameter for cost calculation
+        self.rng = np.random.default_rng() if rng is None else rng  # Random stream (shared by the agents of a run)
+
+        # Top-k candidate destinations (see candidates.py); None = every region is a candidate
+        self.candidate_sets = candidate_sets
+        self.candidates = None  # Candidate regions; weight slot j is region candidates[j]
+        self.slot_of = None  # Region -> weight slot
+        self.candidate_amts = None  # Amenity density of each candidate
+
+        # Shared amenity prior (sampler.SharedPrior) to store weights against sparsely; None = dense weights
+        self.prior = prior
 
         # Step 1: Initialize sampling variables
-        self.weights = None
-        self.probabilities = None
-        self.tot_probabilities = None
+        self.weights = None  # FenwickSampler (or SparseDeltaSampler) over region (or candidate) weights
+        self.prob_sum = None  # LazyProbabilitySum (or SparseProbabilitySum) behind tot_probabilities
         self.avg_probabilities = None
 
         # Step 2: Location tracking
         self.u = None  # Current location
+        self.slot = None  # Weight slot of the current location
         self.prev_u = None  # Previous location
         self.routes = None  # Assigned routes
 
         # Transportation mode (based on car ownership rate)
-        self.mode = 'car' if np.random.random() < car_ownership_rate else 'transit'
+        self.mode = 'car' if self.rng.random() < car_ownership_rate else 'transit'
 
         self.reset()
 
@@ -34,59 +45,113 @@ class Agent:
     def __eq__(self, other):
         return self.i == other.i
 
+    @property
+    def probabilities(self):
+        """Normalized sampling distribution, derived from the weights on demand"""
+        return self._dense(self.weights.probabilities())
+
+    @property
+    def tot_probabilities(self):
+        """Sum of the sampling distribution over all timesteps, settled on demand"""
+        return self._dense(self.prob_sum.settle(self.weights.values))
+
+    def _dense(self, values):
+        """Per-slot values as a vector over all regions (zero outside the candidates)"""
+        if self.candidates is None:
+            return values
+        dense = np.zeros(len(self.city.centroids))
+        dense[self.candidates] = values
+        return dense
+
+    def _region(self, slot):
+        """Region of a weight slot"""
+        return slot if self.candidates is None else int(self.candidates[slot])
+
+    def set_candidates(self, candidates):
+        """Restrict destinations to candidate regions"""
+        self.candidates = candidates
+        self.slot_of = {int(region): j for j, region in enumerate(candidates)}
+        self.candidate_amts = self.city.amts_dens[candidates]
+
     def reset(self):
         # Step 1: Initialize sampling based on amenity densities
-        self.weights = np.ones(len(self.city.centroids))
         amenity_weights = self.city.amts_dens / np.sum(self.city.amts_dens)
-        self.weights = self.weights * amenity_weights
-        self.probabilities = np.array(self.weights / self.weights.sum())
-        self.tot_probabilities = self.probabilities.copy()
+        if self.prior is not None:
+            # Prior plus the regions visited (memory grows with visits, not regions)
+            self.weights = SparseDeltaSampler(self.prior)
+            self.prob_sum = SparseProbabilitySum(self.weights, self.weights.total)
+            self.slot = self.weights.sample(self.rng.random)
+        elif self.candidate_sets is None:
+            self.weights = FenwickSampler(np.ones(len(self.city.centroids)) * amenity_weights)
+            self.prob_sum = LazyProbabilitySum(self.weights.values, self.weights.total)
 
-        # Initialize starting position based on trip generation probabilities
-        self.u = np.random.choice(self.city.n, p=self.probabilities)
-        self.city.inh_array[self.u].add(self)
+            # Initialize starting position based on trip generation probabilities
+            self.slot = self.weights.sample(self.rng.random)
+        else:
+            # Initialize starting position based on trip generation probabilities; then only its candidates are weighted
+            cumulative = np.cumsum(amenity_weights)
+            start = min(int(np.searchsorted(cumulative, self.rng.random() * cumulative[-1], side='right')), len(cumulative) - 1)
+            self.set_candidates(self.candidate_sets.draw([start], self.rng)[0])
+            self.weights = FenwickSampler(amenity_weights[self.candidates])
+            self.prob_sum = LazyProbabilitySum(self.weights.values, self.weights.total)
+            self.slot = self.slot_of[start]
+        self.u = self._region(self.slot)
+        self.city.add_inhabitant(self, self.u)
 
-    def assign_routes(self, assigned_routes):
+    def assign_routes(self, route_tables):
         """Step 2: Route modification based on FSM route assignment"""
-        self.routes = []
-        origin_geoid = self.city.centroids[self.u][4]
+        # O(1) lookup of routes for current mode and origin (see four_step_model.compile_route_tables)
+        self.routes = route_tables.lookup(self.u, self.mode)
 
-        # Filter routes for current mode and origin
-        for (o_geoid, d_geoid, mode), volume in assigned_routes.items():
-            if mode == self.mode and o_geoid == origin_geoid:
-                # Convert destination geoid to index
-                dest_idx = next(i for i, c in enumerate(self.city.centroids) if c[4] == d_geoid)
-                # Add route with weight proportional to volume
-                self.routes.extend([dest_idx] * int(volume))
+        # Only candidate destinations, as weight slots
+        if self.candidates is not None:
+            route_indices, route_volumes = self.routes
+            keep = [k for k, region in enumerate(route_indices) if region in self.slot_of]
+            self.routes = (np.array([self.slot_of[route_indices[k]] for k in keep], dtype=int), route_volumes[keep])
 
     def act(self):
         """Step 2: Movement based on FSM distribution and mode"""
         self.prev_u = self.u
-        self.city.inh_array[self.u].remove(self)
-
-        if self.routes:
-            # Weight routes by both FSM assignment and amenity attractiveness
-            route_indices = np.array(self.routes)
-            route_probs = self.probabilities[route_indices] * self.city.amts_dens[route_indices]
-            route_probs = route_probs / route_probs.sum()  # Normalize
 
-            if len(route_indices) > 0:
-                self.u = np.random.choice(route_indices, p=route_probs)
-            else:
-                self.u = np.random.choice(self.city.n, p=self.probabilities)
+        route_slots, route_volumes = self.routes if self.routes is not None else ((), ())
+        if len(route_slots) > 0:
+            # Weight routes by FSM volume and amenity attractiveness
+            amts_dens = self.city.amts_dens if self.candidates is None else self.candidate_amts
+            route_probs = route_volumes * self.weights.gather(route_slots) * amts_dens[route_slots]
+            cumulative = np.cumsum(route_probs)
+            pick = np.searchsorted(cumulative, self.rng.random() * cumulative[-1], side='right')
+            self.slot = route_slots[min(pick, len(route_slots) - 1)]
         else:
-            self.u = np.random.choice(self.city.n, p=self.probabilities)
+            self.slot = self.weights.sample(self.rng.random)  # O(log n) draw
+        self.u = self._region(self.slot)
+
+        # Keep city's region statistics current (only on an actual move)
+        if self.u != self.prev_u:
+            self.city.remove_inhabitant(self, self.prev_u)
+            self.city.add_inhabitant(self, self.u)
 
-        self.city.inh_array[self.u].add(self)
+    def catch_up(self, timestep):
+        """Count the timesteps up to timestep that this agent sat out (partial update schedules) into tot_probabilities"""
+        self.prob_sum.catch_up(timestep, self.weights.total)
 
-    def learn(self):
-        """Step 3: Update based on cost calculation"""
+    def learn(self, timestep=None):
+        """Step 3: Update based on cost calculation (at timestep, if the agent may have sat out earlier ones)"""
+        if timestep is not None:
+            self.catch_up(timestep - 1)
         cost = self.calculateCost(self.u)
-        self.weights[self.u] *= (1 - EPSILON * cost)
+        self.prob_sum.before_update(self.slot, self.weights[self.slot])
+        self.weights[self.slot] *= (1 - EPSILON * cost)  # O(log n) point update
 
         # Update sampling distribution
-        self.probabilities = self.weights / np.sum(self.weights)
-        self.tot_probabilities += self.probabilities
+        self.prob_sum.step(self.weights.total)
+        if self.weights.total < WEIGHT_RENORM_THRESHOLD:
+            self.renormalize()
+
+    def renormalize(self):
+        """Rescale the weights to sum to 1 (O(n)); tot_probabilities is unchanged"""
+        scale = self.weights.total
+        self.prob_sum.rescale(scale)
+        self.weights.rescale(scale)
 
     def calculateCost(self, u):
         """Step 3: Cost function with mode-specific adjustments"""
@@ -107,11 +172,102 @@ class Agent:
         return cost
 
 
+def agents_checkpoint_state(agents):
+    """Stack the state of a list of agents into arrays (for checkpoint.py)"""
+    if agents[0].prior is not None:
+        return sparse_agents_checkpoint_state(agents)
+    return {
+        'u': np.array([a.u for a in agents]),
+        'slot': np.array([a.slot for a in agents]),
+        'candidates': None if agents[0].candidates is None else np.array([a.candidates for a in agents]),
+        'prev_u': np.array([a.prev_u if a.prev_u is not None else a.u for a in agents]),
+        'transit': np.array([a.mode == 'transit' for a in agents]),
+        'weights': np.array([a.weights.values for a in agents]),
+        'weight_trees': np.array([a.weights.tree for a in agents]),  # Exact partial sums, so draws resume bit-identically
+        'weight_totals': np.array([a.weights.total for a in agents]),
+        'prob_acc': np.array([a.prob_sum.acc for a in agents]),
+        'prob_mark': np.array([a.prob_sum.mark for a in agents]),
+        'inv_total_sums': np.array([a.prob_sum.inv_total_sum for a in agents]),
+        'prob_steps': np.array([a.prob_sum.steps for a in agents]),
+        'rng': agents[0].rng.bit_generator.state,  # Agents of a run share one stream
+    }
+
+
+def sparse_agents_checkpoint_state(agents):
+    """agents_checkpoint_state() of agents with sparse weights: visited entries concatenated over agents"""
+    # Running probability sums are settled exactly at the entries set in the weights, in the same order
+    visited = [list(a.weights.delta) for a in agents]
+    return {
+        'u': np.array([a.u for a in agents]),
+        'slot': np.array([a.slot for a in agents]),
+        'prev_u': np.array([a.prev_u if a.prev_u is not None else a.u for a in agents]),
+        'transit': np.array([a.mode == 'transit' for a in agents]),
+        'num_visited': np.array([len(indices) for indices in visited], dtype=int),
+        'visited': np.array([i for indices in visited for i in indices], dtype=int),
+        'weights': np.array([w for a in agents for w in a.weights.delta.values()]),
+        'weight_scales': np.array([a.weights.scale for a in agents]),
+        'weight_totals': np.array([[a.weights.total, a.weights.delta_total, a.weights.delta_prior] for a in agents]),
+        'prob_acc': np.array([a.prob_sum.acc[i] for a, indices in zip(agents, visited) for i in indices]),
+        'prob_mark': np.array([a.prob_sum.mark[i] for a, indices in zip(agents, visited) for i in indices]),
+        'inv_total_sums': np.array([a.prob_sum.inv_total_sum for a in agents]),
+        'prob_steps': np.array([a.prob_sum.steps for a in agents]),
+        'rng': agents[0].rng.bit_generator.state,
+    }
+
+
+def restore_agents_checkpoint_state(agents, state):
+    """Restore agents (and their city inhabitance) from agents_checkpoint_state()"""
+    if 'visited' in state:
+        return restore_sparse_agents_checkpoint_state(agents, state)
+    for k, agent in enumerate(agents):
+        agent.city.remove_inhabitant(agent, agent.u)
+        agent.u = int(state['u'][k])
+        agent.slot = int(state['slot'][k])
+        if state['candidates'] is not None:
+            agent.set_candidates(state['candidates'][k].copy())
+        agent.prev_u = int(state['prev_u'][k])
+        agent.mode = 'transit' if state['transit'][k] else 'car'
+        agent.weights = FenwickSampler(state['weights'][k])
+        agent.weights.tree = state['weight_trees'][k].tolist()
+        agent.weights.total = float(state['weight_totals'][k])
+        agent.prob_sum.acc = state['prob_acc'][k].copy()
+        agent.prob_sum.mark = state['prob_mark'][k].copy()
+        agent.prob_sum.inv_total_sum = float(state['inv_total_sums'][k])
+        agent.prob_sum.steps = int(state['prob_steps'][k])
+        agent.city.add_inhabitant(agent, agent.u)
+    agents[0].rng.bit_generator.state = state['rng']
+
+
+def restore_sparse_agents_checkpoint_state(agents, state):
+    """Restore agents with sparse weights from sparse_agents_checkpoint_state()"""
+    ends = np.cumsum(state['num_visited'])
+    for k, agent in enumerate(agents):
+        agent.city.remove_inhabitant(agent, agent.u)
+        agent.u = int(state['u'][k])
+        agent.slot = int(state['slot'][k])
+        agent.prev_u = int(state['prev_u'][k])
+        agent.mode = 'transit' if state['transit'][k] else 'car'
+        entries = slice(ends[k] - state['num_visited'][k], ends[k])
+        visited = state['visited'][entries].tolist()
+        agent.weights = SparseDeltaSampler(agent.prior)
+        agent.weights.delta = dict(zip(visited, state['weights'][entries].tolist()))
+        agent.weights.scale = float(state['weight_scales'][k])
+        agent.weights.total, agent.weights.delta_total, agent.weights.delta_prior = state['weight_totals'][k].tolist()
+        agent.prob_sum = SparseProbabilitySum(agent.weights, agent.weights.total)
+        agent.prob_sum.acc = dict(zip(visited, state['prob_acc'][entries].tolist()))
+        agent.prob_sum.mark = dict(zip(visited, state['prob_mark'][entries].tolist()))
+        agent.prob_sum.inv_total_sum = float(state['inv_total_sums'][k])
+        agent.prob_sum.steps = int(state['prob_steps'][k])
+        agent.city.add_inhabitant(agent, agent.u)
+    agents[0].rng.bit_generator.state = state['rng']
+
+
 class Simulation:
-    def __init__(self, city, num_agents):
+    def __init__(self, city, num_agents, rng=None):
         self.city = city
-        self.agents = [Agent(i, np.random.random(), city) for i in range(num_agents)]
-        self.assigned_routes = {}  # Store FSM route assignments
+        rng = np.random.default_rng() if rng is None else rng
+        self.agents = [Agent(i, rng.random(), city, rng=rng) for i in range(num_agents)]
+        self.route_tables = None  # Store compiled FSM route assignments
 
     def step(self):
         """Execute one simulation step"""
@@ -129,15 +285,18 @@ class Simulation:
     def update_routes(self):
         """Update routes based on FSM assignments"""
         for agent in self.agents:
-            agent.assign_routes(self.assigned_routes)
+            if self.route_tables is None:
+                agent.routes = None
+            else:
+                agent.assign_routes(self.route_tables)
 
     def reset(self):
         """Reset simulation state"""
         for agent in self.agents:
             agent.reset()
-        self.assigned_routes = {}
+        self.route_tables = None
 
-    def set_routes(self, fsm_routes):
-        """Update routes from FSM"""
-        self.assigned_routes = fsm_routes
+    def set_routes(self, route_tables):
+        """Update routes from compiled FSM route tables"""
+        self.route_tables = route_tables
         self.update_routes()
\ No newline at end of file
@@ -0,0 +1,225 @@
+# AgentArrays.py
+
+from config import EPSILON, WEIGHT_DTYPE, WEIGHT_RENORM_THRESHOLD
+from schedule import active_agents
+import numpy as np
+
+
+class AgentArrays:
+    """ Struct-of-arrays agent engine; advances every agent at once """
+
+    # Per-agent state saved in checkpoints
+    STATE_ARRAYS = ('u', 'prev_u', 'transit', 'mode_factor', 'weights', 'weight_sums', 'prob_acc', 'prob_mark', 'inv_total_sums', 'prob_steps')
+
+    def __init__(self, dows, city, alpha=0.5, car_ownership_rate=0.7, route_tables=None, rng=None):
+        self.city = city  # City object
+        self.rng = np.random.default_rng() if rng is None else rng  # Random stream
+        self.alpha = alpha  # Weight parameter for cost calculation
+        self.dow = np.asarray(dows, dtype=float)  # Endowments
+        self.num_agents = len(self.dow)
+
+        # Transportation mode (based on car ownership rate); True if transit
+        self.transit = self._uniform(self.num_agents) >= car_ownership_rate
+        self.mode_factor = np.where(self.transit, 0.67, 1.0)
+
+        # Route volumes per (mode, origin) -> destination, from the compiled FSM route tables
+        self._load_routes(route_tables)
+
+        # Step 1: Initialize sampling variables (agents x regions, stored as WEIGHT_DTYPE; sums kept in float64)
+        self.weights = None
+        self.weight_sums = None
+
+        # Lazy running sum of probabilities (see sampler.LazyProbabilitySum), one row per agent
+        self.prob_acc = None
+        self.prob_mark = None
+        self.inv_total_sums = None
+        self.prob_steps = None  # Timesteps counted into inv_total_sums (agents may sit out timesteps)
+        self.timestep = 0
+
+        # Step 2: Location tracking
+        self.u = None  # Current locations
+        self.prev_u = None  # Previous locations
+        self.city_loaded = False  # City holds per-region sorted endowments for incremental moves (see City.load_arrays)
+
+        self.reset()
+
+    def __len__(self):
+        return self.num_agents
+
+    @property
+    def probabilities(self):
+        """ Normalized sampling distributions, derived from the weights on demand """
+        return self.weights / self.weight_sums[:, None]
+
+    def mean_probabilities(self, rows=slice(None)):
+        """ Sampling distribution averaged over agents (rows) """
+        return (self.weights[rows] / self.weight_sums[rows, None]).mean(axis=0)
+
+    @property
+    def tot_probabilities(self):
+        """ Sum of the sampling distributions over all timesteps, settled on demand """
+        return self.prob_acc + self.weights * (self._settled_inv_total_sums()[:, None] - self.prob_mark)
+
+    def _settled_inv_total_sums(self):
+        """ inv_total_sums including the timesteps each agent sat out, with unchanged weights """
+        return self.inv_total_sums + (self.timestep - self.prob_steps) / self.weight_sums
+
+    def reset(self):
+        # Step 1: Initialize sampling based on amenity densities
+        amenity_weights = self.city.amts_dens / np.sum(self.city.amts_dens)
+        self.weights = np.tile(amenity_weights, (self.num_agents, 1)).astype(WEIGHT_DTYPE)
+        self.weight_sums = self.weights.sum(axis=1, dtype=float)
+        self.prob_acc = np.zeros_like(self.weights)
+        self.prob_mark = np.zeros_like(self.weights)
+        self.inv_total_sums = 1.0 / self.weight_sums
+        self.prob_steps = np.zeros(self.num_agents, dtype=int)
+        self.timestep = 0
+
+        # Initialize starting positions based on trip generation probabilities
+        self.u = self._sample_rows(self.weights)
+        self.prev_u = self.u.copy()
+
+    def _load_routes(self, route_tables):
+        """ Dense (mode x origin, destination) route volume matrix """
+        if route_tables is not None:
+            self.route_weights = route_tables.dense()
+        else:
+            self.route_weights = np.zeros((2 * self.city.n, self.city.n))
+
+    def _uniform(self, size):
+        """ Uniform [0, 1) draws, one per agent row """
+        return self.rng.random(size)
+
+    def _sample_rows(self, row_weights, rng=None):
+        """ Draw one column index per row, proportional to (unnormalized) row weights (drawn from rng, if given) """
+        cumulative = np.cumsum(row_weights, axis=1)
+        uniform = self._uniform(len(row_weights)) if rng is None else rng.random(len(row_weights))
+        draws = uniform * cumulative[:, -1]
+        choices = (cumulative <= draws[:, None]).sum(axis=1)
+        return np.minimum(choices, row_weights.shape[1] - 1)
+
+    def act(self, active=None):
+        """ Step 2: Movement based on FSM distribution and mode, for all (or the active) agents """
+        if active is None:
+            self.prev_u = self.u
+            self.u = self._sample_rows(self._move_weights(slice(None)))
+        else:
+            self.prev_u[active] = self.u[active]
+            self.u[active] = self._sample_rows(self._move_weights(active))
+
+    def _move_weights(self, rows):
+        """ Unnormalized destination weights of agents (rows) """
+        # Weight routes by both FSM assignment and amenity attractiveness
+        route_rows = self.route_weights[self.transit[rows] * self.city.n + self.u[rows]]
+        route_probs = route_rows * self.weights[rows] * self.city.amts_dens
+        has_routes = route_probs.sum(axis=1) > 0
+
+        # Agents without routes sample from their own (unnormalized) distribution
+        return np.where(has_routes[:, None], route_probs, self.weights[rows])
+
+    def learn(self, active=None):
+        """ Step 3: Update based on cost calculation, for all (or the active) agents """
+        rows = np.arange(self.num_agents) if active is None else active
+        cost = self.calculateCost(self.u[rows], rows)
+        cols = self._weight_columns()[rows]
+        old_weights = self.weights[rows, cols]
+        new_weights = np.asarray(old_weights * (1 - EPSILON * cost), dtype=self.weights.dtype)  # As stored
+
+        # Count the timesteps these agents sat out (weights unchanged) before this one
+        inv_total_sums = self.inv_total_sums[rows] + (self.timestep - 1 - self.prob_steps[rows]) / self.weight_sums[rows]
+
+        # Settle the running probability sum of the changed entries before their weights change
+        self.prob_acc[rows, cols] += old_weights * (inv_total_sums - self.prob_mark[rows, cols])
+        self.prob_mark[rows, cols] = inv_total_sums
+        self.weights[rows, cols] = new_weights
+
+        # Update sampling distribution
+        self.weight_sums[rows] += new_weights - old_weights
+        self.inv_total_sums[rows] = inv_total_sums + 1.0 / self.weight_sums[rows]
+        self.prob_steps[rows] = self.timestep
+
+        # Rescale agents whose weights decayed too far
+        low = rows[self.weight_sums[rows] < WEIGHT_RENORM_THRESHOLD]
+        if len(low):
+            self.renormalize(low)
+
+    def renormalize(self, rows):
+        """
+        Rescale agents' (rows) weights to sum to 1, re-summed exactly. The running probability sums scale with
+        1 / weight_sums, so inv_total_sums and the marks are multiplied by the same factor; tot_probabilities is unchanged.
+        """
+        scale = self.weights[rows].sum(axis=1, dtype=float)
+        self.weights[rows] = self.weights[rows] / scale[:, None]
+        self.prob_mark[rows] = self.prob_mark[rows] * scale[:, None]
+        self.inv_total_sums[rows] *= scale
+        self.weight_sums[rows] = self.weights[rows].sum(axis=1, dtype=float)
+
+    def _weight_columns(self):
+        """ Column of each agent's current region in its weight row """
+        return self.u
+
+    def calculateCost(self, u, rows=slice(None)):
+        """ Step 3: Cost function with mode-specific adjustments (vector over agents, or agent rows at u) """
+        city = self.city
+        dow = self.dow[rows]
+        alpha = self.alpha[rows] if np.ndim(self.alpha) else self.alpha
+        dow_thr, cmt, upkeep = self._region_scores(u)
+        # Base components
+        affordability = (dow >= dow_thr).astype(float)
+        community_cost = np.exp(-alpha * np.abs(dow - cmt))
+        accessibility = np.exp(-(1 - alpha) * city.amts_dens[u])
+        beltline = city.beltline_score_array[u]
+
+        # Mode-specific adjustments
+        location_score = (1.0 - city.centroid_distances[self.prev_u[rows], u]) * self.mode_factor[rows]
+
+        # Combine costs according to FSM and mode
+        cost = 1 - (affordability * upkeep * beltline * location_score * community_cost * accessibility)
+        return cost
+
+    def _region_scores(self, u):
+        """ Endowment threshold, community and upkeep scores of each agent's region """
+        return self.city.dow_thr_array[u], self.city.cmt_array[u], self.city.upk_array[u]
+
+    def update_city(self, active=None):
+        """ Refresh the city's region statistics from agent positions (incrementally, if only active agents moved) """
+        if active is None:
+            self.city.update_from_arrays(self.u, self.dow)
+            self.city_loaded = False
+            return
+        if not self.city_loaded:
+            before = self.u.copy()
+            before[active] = self.prev_u[active]  # Positions before this step's moves
+            self.city.load_arrays(before, self.dow)
+            self.city_loaded = True
+        self.city.move_arrays(self.prev_u[active], self.u[active], self.dow[active])
+        self.city.update()
+
+    def step(self):
+        """ Execute one simulation step for every agent activated by the update schedule (see schedule.py) """
+        self.timestep += 1
+        active = active_agents(self.num_agents, self.rng)
+        self.act(active)
+        self.update_city(active)
+        self.learn(active)
+
+    def checkpoint_state(self):
+        """ Agent arrays and random state (for checkpoint.py) """
+        state = {name: getattr(self, name).copy() for name in self.STATE_ARRAYS}
+        state['timestep'] = self.timestep
+        state['rng'] = self._rng_state()
+        return state
+
+    def restore_checkpoint_state(self, state):
+        """ Restore from checkpoint_state() """
+        for name in self.STATE_ARRAYS:
+            setattr(self, name, state[name].copy())
+        self.timestep = state['timestep']
+        self.city_loaded = False
+        self._set_rng_state(state['rng'])
+
+    def _rng_state(self):
+        return self.rng.bit_generator.state
+
+    def _set_rng_state(self, rng_state):
+        self.rng.bit_generator.state = rng_state
@@ -0,0 +1,110 @@
+# AgentBlocks.py
+
+from config import WEIGHT_DTYPE
+from AgentArrays import AgentArrays
+from snapshot import probabilities_buffer
+from numpy.lib.format import open_memmap
+from pathlib import Path
+import numpy as np
+import shutil
+
+
+class AgentBlocks(AgentArrays):
+    """
+    Out-of-core AgentArrays: the agents x regions arrays live in memory-mapped .npy files in directory, and agents
+    stream through the act and learn phases in blocks of block_size rows, so only one block of them is paged in at a
+    time. Per-agent scalars (positions, sums) and the City's region statistics stay in memory.
+
+    Random draws are made block by block in row order, so a run matches AgentArrays for any block size.
+    """
+
+    MAPPED_ARRAYS = ('weights', 'prob_acc', 'prob_mark')  # Checkpointed as file copies, named by timestep
+    STATE_ARRAYS = ('u', 'prev_u', 'transit', 'mode_factor', 'weight_sums', 'inv_total_sums', 'prob_steps')
+
+    def __init__(self, dows, city, directory, block_size, alpha=0.5, car_ownership_rate=0.7, route_tables=None, rng=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.block_size = max(int(block_size), 1)
+        self.checkpoint_step = None  # Timestep of the last checkpoint's file copies
+        super().__init__(dows, city, alpha=alpha, car_ownership_rate=car_ownership_rate, route_tables=route_tables, rng=rng)
+
+    def _path(self, name, step=None):
+        """ File of a mapped array (or of its copy for the checkpoint at step) """
+        return self.directory / (f"{name}.npy" if step is None else f"{name}.{step}.npy")
+
+    def _blocks(self, active=None):
+        """ Slices of up to block_size agent rows (or blocks of the active rows) """
+        if active is None:
+            return [slice(start, min(start + self.block_size, self.num_agents)) for start in range(0, self.num_agents, self.block_size)]
+        return [active[start:start + self.block_size] for start in range(0, len(active), self.block_size)]
+
+    def reset(self):
+        # Step 1: Initialize sampling based on amenity densities, block by block into fresh mapped files
+        amenity_weights = (self.city.amts_dens / np.sum(self.city.amts_dens)).astype(WEIGHT_DTYPE)
+        for name in self.MAPPED_ARRAYS:
+            setattr(self, name, open_memmap(self._path(name), mode='w+', dtype=WEIGHT_DTYPE, shape=(self.num_agents, self.city.n)))
+        self.weight_sums = np.empty(self.num_agents)
+        self.u = np.empty(self.num_agents, dtype=int)
+        for rows in self._blocks():
+            self.weights[rows] = amenity_weights
+            self.prob_acc[rows] = 0.0
+            self.prob_mark[rows] = 0.0
+            self.weight_sums[rows] = self.weights[rows].sum(axis=1, dtype=float)
+
+            # Initialize starting positions based on trip generation probabilities
+            self.u[rows] = self._sample_rows(self.weights[rows])
+        self.inv_total_sums = 1.0 / self.weight_sums
+        self.prob_steps = np.zeros(self.num_agents, dtype=int)
+        self.timestep = 0
+        self.prev_u = self.u.copy()
+
+    def mean_probabilities(self):
+        """ Sampling distribution averaged over agents, block by block """
+        total = np.zeros(self.city.n)
+        for rows in self._blocks():
+            total += (self.weights[rows] / self.weight_sums[rows, None]).sum(axis=0)
+        return total / self.num_agents
+
+    def average_probabilities(self, steps):
+        """ tot_probabilities / steps as float32 (as snapshots store it), block by block into an unlinked temporary file """
+        average = probabilities_buffer(self.num_agents, self.city.n, self.directory)
+        settled = self._settled_inv_total_sums()
+        for rows in self._blocks():
+            average[rows] = (self.prob_acc[rows] + self.weights[rows] * (settled[rows, None] - self.prob_mark[rows])) / steps
+        return average
+
+    def act(self, active=None):
+        """ Step 2: Movement based on FSM distribution and mode, block by block """
+        for rows in self._blocks(active):
+            super().act(rows)
+
+    def learn(self, active=None):
+        """ Step 3: Update based on cost calculation, block by block """
+        for rows in self._blocks(active):
+            super().learn(np.arange(rows.start, rows.stop) if isinstance(rows, slice) else rows)
+
+    def checkpoint_state(self):
+        """ In-memory agent arrays and random state; the mapped arrays are copied to files named by timestep """
+        state = super().checkpoint_state()
+        for name in self.MAPPED_ARRAYS:
+            getattr(self, name).flush()
+            shutil.copyfile(self._path(name), self._path(name, self.timestep))
+
+        # Copies older than the checkpoint being replaced are no longer referenced
+        keep = {self._path(name, step) for name in self.MAPPED_ARRAYS for step in (self.checkpoint_step, self.timestep)}
+        for name in self.MAPPED_ARRAYS:
+            for path in self.directory.glob(f"{name}.*.npy"):
+                if path not in keep:
+                    path.unlink()
+        self.checkpoint_step = state['mapped_step'] = self.timestep
+        return state
+
+    def restore_checkpoint_state(self, state):
+        """ Restore from checkpoint_state(), copying the mapped arrays back block by block """
+        super().restore_checkpoint_state(state)
+        self.checkpoint_step = state['mapped_step']
+        for name in self.MAPPED_ARRAYS:
+            saved = np.load(self._path(name, self.checkpoint_step), mmap_mode='r')
+            target = getattr(self, name)
+            for rows in self._blocks():
+                target[rows] = saved[rows]
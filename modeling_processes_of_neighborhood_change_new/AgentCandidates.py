@@ -0,0 +1,105 @@
+# AgentCandidates.py
+
+from config import WEIGHT_DTYPE
+from AgentArrays import AgentArrays
+import numpy as np
+
+
+class AgentCandidates(AgentArrays):
+    """
+    AgentArrays over a sparse candidate set per agent (see candidates.CandidateSets): weights, probabilities and
+    per-step work are (agents x candidates) instead of (agents x regions).
+
+    Column j of an agent's weight row is region candidates[agent, j]; slot is the column of its current region.
+    """
+
+    STATE_ARRAYS = AgentArrays.STATE_ARRAYS + ('candidates', 'slot')
+
+    def __init__(self, dows, city, candidate_sets, alpha=0.5, car_ownership_rate=0.7, route_tables=None, rng=None):
+        self.candidate_sets = candidate_sets
+        self.candidates = None  # Candidate regions (agents x candidates)
+        self.slot = None  # Column of each agent's current region
+        super().__init__(dows, city, alpha=alpha, car_ownership_rate=car_ownership_rate, route_tables=route_tables, rng=rng)
+
+    def _dense(self, sparse):
+        """ Scatter (agents x candidates) values into (agents x regions) """
+        dense = np.zeros((self.num_agents, self.city.n))
+        dense[np.arange(self.num_agents)[:, None], self.candidates] = sparse
+        return dense
+
+    @property
+    def probabilities(self):
+        """ Normalized sampling distributions over all regions (zero outside the candidates) """
+        return self._dense(self.weights / self.weight_sums[:, None])
+
+    @property
+    def tot_probabilities(self):
+        """ Sum of the sampling distributions over all timesteps, over all regions """
+        return self._dense(self.prob_acc + self.weights * (self._settled_inv_total_sums()[:, None] - self.prob_mark))
+
+    def mean_probabilities(self, rows=slice(None)):
+        """ Sampling distribution averaged over agents (rows) """
+        candidates = self.candidates[rows]
+        probabilities = self.weights[rows] / self.weight_sums[rows, None]
+        return np.bincount(candidates.ravel(), weights=probabilities.ravel(), minlength=self.city.n) / len(candidates)
+
+    def reset(self):
+        # Initialize starting positions based on amenity densities, then each agent's candidates around its start
+        amenity_weights = self.city.amts_dens / np.sum(self.city.amts_dens)
+        cumulative = np.cumsum(amenity_weights)
+        starts = np.searchsorted(cumulative, self._uniform(self.num_agents) * cumulative[-1], side='right')
+        self.u = np.minimum(starts, self.city.n - 1)
+        self.prev_u = self.u.copy()
+        self.candidates = self.candidate_sets.draw(self.u, self.rng)
+        self.slot = np.argmax(self.candidates == self.u[:, None], axis=1)
+
+        # Step 1: Initialize sampling based on amenity densities, over the candidates
+        self.weights = amenity_weights[self.candidates].astype(WEIGHT_DTYPE)
+        self.weight_sums = self.weights.sum(axis=1, dtype=float)
+        self.prob_acc = np.zeros_like(self.weights)
+        self.prob_mark = np.zeros_like(self.weights)
+        self.inv_total_sums = 1.0 / self.weight_sums
+        self.prob_steps = np.zeros(self.num_agents, dtype=int)
+        self.timestep = 0
+
+    def act(self, active=None):
+        """ Step 2: Movement based on FSM distribution and mode, among each agent's candidates """
+        if active is None:
+            self.prev_u = self.u
+            self.slot = self._sample_rows(self._move_weights(slice(None)))
+            self.u = self.candidates[np.arange(self.num_agents), self.slot]
+        else:
+            self.prev_u[active] = self.u[active]
+            self.slot[active] = self._sample_rows(self._move_weights(active))
+            self.u[active] = self.candidates[active, self.slot[active]]
+
+    def _load_routes(self, route_tables):
+        """ Route volumes kept sparse, keyed by (mode x origin) x regions + destination in ascending order """
+        self.route_keys = np.zeros(0, dtype=int)
+        self.route_volumes = np.zeros(0)
+        if route_tables is not None:
+            rows = np.repeat(np.arange(len(route_tables.offsets) - 1), np.diff(route_tables.offsets))
+            self.route_keys = rows * self.city.n + route_tables.dest_indices
+            self.route_volumes = route_tables.volumes
+
+    def _route_volumes(self, route_rows, candidates):
+        """ Route volumes from each route row to its candidate columns (0 without a route) """
+        if not len(self.route_keys):
+            return np.zeros(candidates.shape)
+        keys = route_rows[:, None] * self.city.n + candidates
+        index = np.minimum(np.searchsorted(self.route_keys, keys), len(self.route_keys) - 1)
+        return np.where(self.route_keys[index] == keys, self.route_volumes[index], 0.0)
+
+    def _move_weights(self, rows):
+        candidates = self.candidates[rows]
+
+        # Weight routes by both FSM assignment and amenity attractiveness
+        route_rows = self.transit[rows] * self.city.n + self.u[rows]
+        route_probs = self._route_volumes(route_rows, candidates) * self.weights[rows] * self.city.amts_dens[candidates]
+        has_routes = route_probs.sum(axis=1) > 0
+
+        # Agents without (candidate) routes sample from their own (unnormalized) distribution
+        return np.where(has_routes[:, None], route_probs, self.weights[rows])
+
+    def _weight_columns(self):
+        return self.slot
@@ -0,0 +1,204 @@
+# AgentCohorts.py
+
+from config import EPSILON, COHORT_BINS, WEIGHT_RENORM_THRESHOLD
+from schedule import active_counts
+import numpy as np
+
+
+class AgentCohorts:
+    """
+    Income-cohort (mean-field) engine: agents with the same endowment level and mode form one cohort, tracked as
+    inhabitant counts per region with one shared sampling weight vector. Each step moves the agents with two batched
+    multinomial draws - one over every routed (cohort, origin) pair's route row, one per cohort for the origins without
+    routes. A step visits each occupied (cohort, region) pair once, so its cost is bounded by cohorts x regions
+    (x routes per origin) however many agents there are.
+    """
+
+    # Per-cohort state saved in checkpoints
+    STATE_ARRAYS = ('counts', 'weights', 'weight_sums', 'tot_probabilities')
+
+    def __init__(self, dows, city, alpha=0.5, car_ownership_rate=0.7, route_tables=None, rng=None, num_bins=COHORT_BINS):
+        self.city = city  # City object
+        self.alpha = alpha  # Weight parameter for cost calculation
+        self.rng = np.random.default_rng() if rng is None else rng  # Random stream
+        self.num_agents = len(dows)
+
+        # Cohorts: (endowment level, car) followed by (endowment level, transit); empty ones dropped
+        levels, level_of = self._endowment_levels(np.asarray(dows, dtype=float), num_bins)
+        level_sizes = np.bincount(level_of, minlength=len(levels))
+        num_transit = self.rng.binomial(level_sizes, 1 - car_ownership_rate)  # Transportation mode (based on car ownership rate)
+        sizes = np.concatenate((level_sizes - num_transit, num_transit))
+        keep = sizes > 0
+        self.sizes = sizes[keep]  # Agents per cohort
+        self.cohort_dow = np.tile(levels, 2)[keep]  # Endowment of each cohort
+        self.transit = np.repeat([False, True], len(levels))[keep]  # True if transit
+        self.mode_factor = np.where(self.transit, 0.67, 1.0)
+        self.num_cohorts = len(self.sizes)
+
+        # Route volumes per (mode, origin) -> destination, kept as the compiled FSM route tables' sparse rows
+        if route_tables is not None:
+            self.route_offsets = route_tables.offsets
+            self.route_dests = route_tables.dest_indices
+            self.route_volumes = route_tables.volumes
+        else:
+            self.route_offsets = np.zeros(2 * city.n + 1, dtype=int)
+            self.route_dests = np.zeros(0, dtype=int)
+            self.route_volumes = np.zeros(0)
+
+        # Step 1: Initialize sampling variables (cohorts x regions)
+        self.weights = None
+        self.weight_sums = None
+        self.tot_probabilities = None  # Sum of each cohort's sampling distribution over all timesteps
+
+        # Step 2: Location tracking
+        self.counts = None  # Inhabitants per (cohort, region)
+        self.arrivals = None  # Agents per (cohort, region) that moved there in the last act()
+        self.location_sums = None  # Per (cohort, region): sum over those arrivals of 1 - distance from their origin
+
+        self.reset()
+
+    def __len__(self):
+        return self.num_agents
+
+    @staticmethod
+    def _endowment_levels(dows, num_bins):
+        """ Endowment levels (exact if there are at most num_bins, else quantile-bin means) and each agent's level """
+        levels, level_of = np.unique(dows, return_inverse=True)
+        if len(levels) <= num_bins:
+            return levels, level_of
+
+        edges = np.quantile(dows, np.linspace(0, 1, num_bins + 1)[1:-1])
+        level_of = np.searchsorted(edges, dows, side='right')
+        bin_sizes = np.bincount(level_of, minlength=num_bins)
+        bin_sums = np.bincount(level_of, weights=dows, minlength=num_bins)
+        used = bin_sizes > 0
+        return bin_sums[used] / bin_sizes[used], (np.cumsum(used) - 1)[level_of]
+
+    @property
+    def probabilities(self):
+        """ Normalized sampling distribution of each cohort """
+        return self.weights / self.weight_sums[:, None]
+
+    def mean_probabilities(self):
+        """ Sampling distribution averaged over agents """
+        return self.sizes @ self.probabilities / self.num_agents
+
+    @property
+    def u(self):
+        """ Agent positions, cohort by cohort """
+        regions = np.tile(np.arange(self.city.n), self.num_cohorts)
+        return np.repeat(regions, self.counts.ravel())
+
+    @property
+    def dow(self):
+        """ Agent endowments, in the same cohort-by-cohort order as u """
+        return np.repeat(self.cohort_dow, self.sizes)
+
+    def reset(self):
+        # Step 1: Initialize sampling based on amenity densities
+        amenity_weights = self.city.amts_dens / np.sum(self.city.amts_dens)
+        self.weights = np.tile(amenity_weights, (self.num_cohorts, 1))
+        self.weight_sums = self.weights.sum(axis=1)
+        self.tot_probabilities = self.probabilities.copy()
+
+        # Initialize starting positions based on trip generation probabilities
+        self.counts = self.rng.multinomial(self.sizes, self.probabilities)
+
+    def act(self, movers=None):
+        """ Step 2: Movement based on FSM distribution and mode, for all (or movers) agents, in two batched draws """
+        movers = self.counts if movers is None else movers
+        n = self.city.n
+        distances = self.city.centroid_distances
+        self.arrivals = np.zeros_like(self.counts)
+        self.location_sums = np.zeros(self.counts.shape)
+
+        # (cohort, origin) pairs with movers, and their route rows padded to the longest one: (pairs, routes)
+        cohorts, origins = np.nonzero(movers)
+        rows = self.transit[cohorts] * n + origins
+        starts, lengths = self.route_offsets[rows], np.diff(self.route_offsets)[rows]
+        columns = np.arange(lengths.max(initial=0))
+        has_route = columns < lengths[:, None]
+        entries = np.where(has_route, starts[:, None] + columns, 0)
+        dests = self.route_dests[entries]
+
+        # Weight routes by both FSM assignment and amenity attractiveness
+        route_probs = np.where(has_route, self.route_volumes[entries], 0.0)
+        route_probs *= self.weights[cohorts[:, None], dests] * self.city.amts_dens[dests]
+        route_sums = route_probs.sum(axis=1)
+        routed = route_sums > 0
+
+        # Routed pairs: one multinomial draw over all of them
+        if routed.any():
+            flows = self.rng.multinomial(movers[cohorts[routed], origins[routed]], route_probs[routed] / route_sums[routed, None])
+            keys = (cohorts[routed, None] * n + dests[routed]).ravel()
+            closeness = 1.0 - distances[origins[routed, None], dests[routed]]
+            shape = self.counts.shape
+            self.arrivals += np.bincount(keys, weights=flows.ravel(), minlength=self.counts.size).reshape(shape).astype(int)
+            self.location_sums += np.bincount(keys, weights=(flows * closeness).ravel(), minlength=self.counts.size).reshape(shape)
+
+        # Origins without routes sample from the cohort's own distribution: one draw per cohort for all of them
+        free = np.zeros_like(movers)
+        free[cohorts[~routed], origins[~routed]] = movers[cohorts[~routed], origins[~routed]]
+        free_totals = free.sum(axis=1)
+        active = np.flatnonzero(free_totals)
+        draws = self.rng.multinomial(free_totals[active], self.probabilities[active])
+        self.arrivals[active] += draws
+
+        # Destinations are drawn independently of the origin, so each arrival's location score is its mean over them
+        mean_scores = 1.0 - free[active] @ distances / free_totals[active, None]
+        self.location_sums[active] += draws * mean_scores
+        self.counts = self.counts - movers + self.arrivals
+
+    def learn(self):
+        """ Step 3: Mean-field update - each cohort's weights take the expected update of its moving agents """
+        cost_sums = self.calculateCost()
+        self.weights *= 1 - EPSILON * cost_sums / self.sizes[:, None]
+
+        # Update sampling distribution
+        self.weight_sums = self.weights.sum(axis=1)
+        self.tot_probabilities += self.probabilities
+
+        # Rescale decayed cohorts' weights to sum to 1 (probabilities are unchanged)
+        low = self.weight_sums < WEIGHT_RENORM_THRESHOLD
+        if low.any():
+            self.weights[low] /= self.weight_sums[low, None]
+            self.weight_sums[low] = self.weights[low].sum(axis=1)
+
+    def calculateCost(self):
+        """ Step 3: Summed cost of each cohort's arrivals in each region, with mode-specific adjustments """
+        city = self.city
+        dow = self.cohort_dow[:, None]
+
+        # Base components
+        affordability = (dow >= city.dow_thr_array).astype(float)
+        community_cost = np.exp(-self.alpha * np.abs(dow - city.cmt_array))
+        accessibility = np.exp(-(1 - self.alpha) * city.amts_dens)
+        satisfaction = affordability * city.upk_array * city.beltline_score_array * community_cost * accessibility
+
+        # Mode-specific adjustments; location score summed over each arrival's origin (see act)
+        location_sums = self.location_sums * self.mode_factor[:, None]
+
+        # sum over arrivals of (1 - satisfaction * location_score)
+        return self.arrivals - satisfaction * location_sums
+
+    def update_city(self):
+        """ Refresh the city's region statistics from cohort counts """
+        self.city.update_from_cohorts(self.counts, self.cohort_dow)
+
+    def step(self):
+        """ Execute one simulation step for every cohort (moving the agents activated by the update schedule) """
+        self.act(active_counts(self.counts, self.rng))
+        self.update_city()
+        self.learn()
+
+    def checkpoint_state(self):
+        """ Cohort arrays and random state (for checkpoint.py) """
+        state = {name: getattr(self, name).copy() for name in self.STATE_ARRAYS}
+        state['rng'] = self.rng.bit_generator.state
+        return state
+
+    def restore_checkpoint_state(self, state):
+        """ Restore from checkpoint_state() """
+        for name in self.STATE_ARRAYS:
+            setattr(self, name, state[name].copy())
+        self.rng.bit_generator.state = state['rng']
@@ -0,0 +1,76 @@
+# AgentEnsemble.py
+
+from AgentArrays import AgentArrays
+import numpy as np
+
+
+class AgentEnsemble(AgentArrays):
+    """
+    R replicas of AgentArrays, each with its own City (rho), alpha and random stream, advanced in lock-step.
+
+    Agent rows are laid out replica-major: rows [r * N, (r + 1) * N) belong to replica r.
+    """
+
+    def __init__(self, dows, cities, alphas, rngs, car_ownership_rate=0.7, route_tables=None):
+        self.cities = cities  # One City per replica
+        self.num_replicas = len(cities)
+        self.agents_per_replica = len(dows)
+        self.rngs = list(rngs)  # One random stream per replica
+        self.replica = np.repeat(np.arange(self.num_replicas), self.agents_per_replica)  # Replica of each row
+
+        # Cities share geometry, amenities and distances; only rho (and thus region scores) differ
+        super().__init__(
+            np.tile(dows, self.num_replicas),
+            cities[0],
+            alpha=np.repeat(np.asarray(alphas, dtype=float), self.agents_per_replica),
+            car_ownership_rate=car_ownership_rate,
+            route_tables=route_tables,
+        )
+
+    def _uniform(self, size):
+        """ Uniform [0, 1) draws, each replica's rows from its own stream """
+        per_replica = size // self.num_replicas
+        return np.concatenate([rng.random(per_replica) for rng in self.rngs])
+
+    def _rng_state(self):
+        return [rng.bit_generator.state for rng in self.rngs]
+
+    def _set_rng_state(self, rng_state):
+        for rng, state in zip(self.rngs, rng_state):
+            rng.bit_generator.state = state
+
+    def _rows(self, r):
+        return slice(r * self.agents_per_replica, (r + 1) * self.agents_per_replica)
+
+    def _region_scores(self, u):
+        """ Endowment threshold, community and upkeep scores of each row's region in its replica's City """
+        dow_thr = np.stack([city.dow_thr_array for city in self.cities])
+        cmt = np.stack([city.cmt_array for city in self.cities])
+        upk = np.stack([city.upk_array for city in self.cities])
+        return dow_thr[self.replica, u], cmt[self.replica, u], upk[self.replica, u]
+
+    def update_city(self, active=None):
+        """ Refresh every replica's City from its agents' positions (the ensemble always moves every agent) """
+        for r, city in enumerate(self.cities):
+            rows = self._rows(r)
+            city.update_from_arrays(self.u[rows], self.dow[rows])
+
+    def replica_agents(self, r):
+        """ Compact copy of replica r's agent state, to attach to its City when saving """
+        return ReplicaAgents(self, r)
+
+
+class ReplicaAgents:
+    """ One replica's slice of an AgentEnsemble (arrays copied; no back-reference to the ensemble) """
+
+    def __init__(self, ensemble, r):
+        rows = ensemble._rows(r)
+        self.alpha = float(ensemble.alpha[rows.start])
+        self.dow = ensemble.dow[rows].copy()
+        self.u = ensemble.u[rows].copy()
+        self.transit = ensemble.transit[rows].copy()
+        self.tot_probabilities = ensemble.prob_acc[rows] + ensemble.weights[rows] * (
+            ensemble.inv_total_sums[rows, None] - ensemble.prob_mark[rows])
+
+    def __len__(self):
+        return len(self.dow)
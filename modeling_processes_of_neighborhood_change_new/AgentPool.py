@@ -0,0 +1,150 @@
+# AgentPool.py
+
+from config import IMMIGRATION_RATE, EMIGRATION_RATE, UPDATE_SCHEDULE
+from AgentArrays import AgentArrays
+from schedule import active_agents
+import numpy as np
+
+
+class AgentPool(AgentArrays):
+    """
+    AgentArrays over a preallocated pool of capacity rows, for a population that changes by migration.
+
+    Rows of agents living in the city are marked alive; the others wait on a free-list. An arrival takes a free row
+    and a departure returns it, so neither moves other agents or reallocates the per-agent arrays.
+    """
+
+    STATE_ARRAYS = AgentArrays.STATE_ARRAYS + ('dow', 'alive', 'born')
+
+    def __init__(self, dows, city, capacity, alpha=0.5, car_ownership_rate=0.7, route_tables=None, rng=None):
+        self.initial_dows = np.asarray(dows, dtype=float)  # Immigrant endowments are drawn from these
+        self.num_initial = len(self.initial_dows)
+        self.car_ownership_rate = car_ownership_rate
+        self.alive = None  # True for rows of agents living in the city
+        self.born = None  # Timestep before each agent's arrival (0 for the initial population)
+        self.free = None  # Free rows (stack, lowest row on top)
+        self.num_alive = 0
+
+        capacity = max(int(capacity), self.num_initial)
+        pool_dows = np.concatenate((self.initial_dows, np.zeros(capacity - self.num_initial)))
+        super().__init__(pool_dows, city, alpha=alpha, car_ownership_rate=car_ownership_rate, route_tables=route_tables, rng=rng)
+
+    def __len__(self):
+        return self.num_alive
+
+    def reset(self):
+        super().reset()
+        self.fresh_weights = (self.city.amts_dens / np.sum(self.city.amts_dens)).astype(self.weights.dtype)  # Of every new agent
+        self.fresh_weight_sum = self.fresh_weights.sum(dtype=float)
+        self.alive = np.arange(self.num_agents) < self.num_initial
+        self.born = np.zeros(self.num_agents, dtype=int)
+        self.free = list(range(self.num_agents - 1, self.num_initial - 1, -1))
+        self.num_alive = self.num_initial
+
+    def mean_probabilities(self, rows=None):
+        """ Sampling distribution averaged over living agents (or rows) """
+        return super().mean_probabilities(self.alive if rows is None else rows)
+
+    def add(self, dow):
+        """
+        An immigrant with endowment dow takes a free row; returns the row, or None if the pool is full.
+        O(regions): the row's weights and running sums are dense and are reset by copying the initial weights
+        """
+        if not self.free:
+            return None
+        row = self.free.pop()
+        self.alive[row] = True
+        self.num_alive += 1
+        self.dow[row] = dow
+        self.transit[row] = self._uniform(1)[0] >= self.car_ownership_rate
+        self.mode_factor[row] = 0.67 if self.transit[row] else 1.0
+
+        # Fresh sampling state, based on amenity densities; its first timestep is this one
+        self.weights[row] = self.fresh_weights
+        self.weight_sums[row] = self.fresh_weight_sum
+        self.prob_acc[row] = 0.0
+        self.prob_mark[row] = 0.0
+        self.inv_total_sums[row] = 1.0 / self.weight_sums[row]
+        self.prob_steps[row] = self.born[row] = self.timestep - 1
+
+        # Starting position based on trip generation probabilities
+        self.u[row] = self.prev_u[row] = self._sample_rows(self.weights[row:row + 1])[0]
+        if self.city_loaded:
+            self.city.add_arrays(self.u[row:row + 1], self.dow[row:row + 1])
+        return row
+
+    def remove(self, row):
+        """ The agent in row leaves the city; its row returns to the free-list """
+        self.alive[row] = False
+        self.num_alive -= 1
+        self.free.append(row)
+        if self.city_loaded:
+            self.city.remove_arrays(self.u[row:row + 1], self.dow[row:row + 1])
+
+    def migrate(self):
+        """ Emigration (each agent leaves with probability EMIGRATION_RATE), then IMMIGRATION_RATE arrivals on average """
+        living = np.flatnonzero(self.alive)
+        for row in living[self._uniform(len(living)) < EMIGRATION_RATE].tolist():
+            self.remove(row)
+        for _ in range(self.rng.poisson(IMMIGRATION_RATE * self.num_initial)):
+            if self.add(self.rng.choice(self.initial_dows)) is None:
+                break  # Pool full: further immigrants are turned away
+
+    def update_city(self, active=None):
+        """
+        Refresh the city's region statistics from the positions of living agents; if only active agents moved, apply
+        their moves (and this step's arrivals and departures, see add and remove) to the regions they touched
+        """
+        if active is None:
+            self.city.update_from_arrays(self.u[self.alive], self.dow[self.alive])
+            self.city_loaded = False
+            return
+        self.city.move_arrays(self.prev_u[active], self.u[active], self.dow[active])
+        self.city.update()
+
+    def step(self):
+        """ Execute one simulation step: migration, then the living agents activated by the update schedule """
+        self.timestep += 1
+        if not self.city_loaded and UPDATE_SCHEDULE != 'all':
+            self.city.load_arrays(self.u[self.alive], self.dow[self.alive])  # Region statistics match these positions
+            self.city_loaded = True
+        self.migrate()
+        active = np.flatnonzero(self.alive)
+        scheduled = active_agents(len(active), self.rng)
+        if scheduled is not None:
+            active = active[scheduled]
+        self.act(active)
+        self.update_city(None if scheduled is None else active)
+        self.learn(active)
+
+    def checkpoint_state(self):
+        state = super().checkpoint_state()
+        state['free'] = np.array(self.free, dtype=int)
+        return state
+
+    def restore_checkpoint_state(self, state):
+        super().restore_checkpoint_state(state)
+        self.free = state['free'].tolist()
+        self.num_alive = int(self.alive.sum())
+
+    def live_agents(self):
+        """ Compact copy of the living agents, to attach to the City when saving """
+        return LiveAgents(self)
+
+
+class LiveAgents:
+    """ The living agents of an AgentPool (arrays copied; no back-reference to the pool) """
+
+    def __init__(self, pool):
+        rows = pool.alive
+        self.alpha = pool.alpha
+        self.dow = pool.dow[rows].copy()
+        self.u = pool.u[rows].copy()
+        self.transit = pool.transit[rows].copy()
+
+        # Scaled so that dividing by the run's timesteps averages over each agent's own stay
+        lived = pool.timestep - pool.born[rows]
+        self.tot_probabilities = pool.tot_probabilities[rows] * (pool.timestep / np.maximum(lived, 1))[:, None]
+
+    def __len__(self):
+        return len(self.dow)
@@ -0,0 +1,77 @@
+# AgentShards.py
+
+from AgentArrays import AgentArrays
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+class AgentShards(AgentArrays):
+    """
+    AgentArrays split into contiguous shards of agent rows, each with its own random stream, whose act and learn
+    phases run on worker threads (NumPy releases the GIL). Between the phases the city reduces per-shard region
+    statistics in shard order, so a run is reproducible for a given seed and shard count, however threads interleave.
+    Shards only run faster on several cores, as far as NumPy releases the GIL in _move_weights, _sample_rows and learn.
+    """
+
+    def __init__(self, dows, city, rngs, alpha=0.5, car_ownership_rate=0.7, route_tables=None):
+        self.rngs = list(rngs)  # One random stream per shard
+        self.num_shards = len(self.rngs)
+        self.bounds = np.arange(self.num_shards + 1) * len(dows) // self.num_shards  # Shard k: rows [bounds[k], bounds[k + 1])
+        self.executor = ThreadPoolExecutor(max_workers=self.num_shards)
+        super().__init__(dows, city, alpha=alpha, car_ownership_rate=car_ownership_rate, route_tables=route_tables, rng=self.rngs[0])
+
+    def _rows(self, k):
+        return slice(self.bounds[k], self.bounds[k + 1])
+
+    def _map(self, fn):
+        """ fn(k) for every shard, on the worker threads; results in shard order """
+        return list(self.executor.map(fn, range(self.num_shards)))
+
+    def _uniform(self, size):
+        """ Uniform [0, 1) draws, each shard's rows from its own stream """
+        return np.concatenate([rng.random(self.bounds[k + 1] - self.bounds[k]) for k, rng in enumerate(self.rngs)])
+
+    def act(self, active=None):
+        """ Step 2: Movement based on FSM distribution and mode, shard by shard in parallel (every agent moves) """
+        self._check_all(active)
+        u = np.empty_like(self.u)
+
+        def act_shard(k):
+            rows = self._rows(k)
+            u[rows] = self._sample_rows(self._move_weights(rows), self.rngs[k])
+
+        self._map(act_shard)
+        self.prev_u, self.u = self.u, u
+
+    def learn(self, active=None):
+        """ Step 3: Update based on cost calculation, shard by shard in parallel (shards write disjoint rows) """
+        self._check_all(active)
+        learn = super().learn
+        self._map(lambda k: learn(np.arange(self.bounds[k], self.bounds[k + 1])))
+
+    @staticmethod
+    def _check_all(active):
+        if active is not None:
+            raise ValueError("AgentShards updates every agent each step (UPDATE_SCHEDULE 'all'); got active agents")
+
+    def update_city(self, active=None):
+        """ Refresh the city's region statistics, reduced from per-shard statistics """
+        self.city.update_from_partials(self._map(lambda k: self.city.partial_stats(self.u[self._rows(k)], self.dow[self._rows(k)])))
+
+    def step(self):
+        """ Execute one simulation step for every agent """
+        self.timestep += 1
+        self.act()
+        self.update_city()
+        self.learn()
+
+    def close(self):
+        """ Stop the worker threads (once the run is finished) """
+        self.executor.shutdown()
+
+    def _rng_state(self):
+        return [rng.bit_generator.state for rng in self.rngs]
+
+    def _set_rng_state(self, rng_state):
+        for rng, state in zip(self.rngs, rng_state):
+            rng.bit_generator.state = state
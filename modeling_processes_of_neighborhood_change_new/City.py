@@ -1,8 +1,12 @@
 # City.py
 
+from config import T_MAX_RANGE, HISTORY_EVERY, HISTORY_WINDOW, HISTORY_SPILL_CHUNK
+from history import HistoryBuffer
+from community_kernel import build_community_kernel, smoothed_community
+from bisect import insort, bisect_left
 import numpy as np
 import pandas as pd
-import osmnx as ox
+from graph_handler import cached_centroid_nodes
 
 
 # ==========
@@ -11,11 +15,11 @@ import osmnx as ox
 
 class City:
 
-    def __init__(self, centroids, g, amts_dens, centroid_distances, rho, geo_id_to_income):
+    def __init__(self, centroids, g, amts_dens, centroid_distances, rho, geo_id_to_income, history_dir=None, node_array=None):
         """ Constructor """
         self.rho = int(rho)  # house capacity
         self.centroids = centroids  # centroids list
-        self.g = g  # OSM graph
+        self.g = g  # OSM graph (may be None if node_array is given)
         self.n = len(centroids) # num centroids
 
         # STORE ATTRIBUTES OF ALL CENTROIDS
@@ -29,17 +33,29 @@ class City:
         self.dow_thr_array = np.zeros(self.n)  # Endowment threshold
         self.upk_array = np.zeros(self.n, dtype=bool)  # Upkeep score
         self.cmt_array = np.zeros(self.n)  # Community score
+        self.pop_array = np.zeros(self.n, dtype=int)  # Population
+        self.avg_dow_array = np.zeros(self.n)  # Average inhabitant endowment
 
-        self.pop_hist = [[] for _ in range(self.n)]  # Population history - list of lists
-        self.cmt_hist = [[] for _ in range(self.n)]  # Community score history - list of lists
+        # Per-region sufficient statistics, kept current on every move (see add_inhabitant/remove_inhabitant)
+        self.dow_sum_array = np.zeros(self.n)  # Sum of inhabitant endowments
+        self.sorted_dows = [[] for _ in range(self.n)]  # Inhabitant endowments in ascending order
+        self.dirty = set()  # Regions whose scores changed since the last update()
 
-        self.node_array = np.array(
-            [ox.nearest_nodes(self.g, lon, lat) for lon, lat in zip(self.lon_array, self.lat_array)])
+        # Population / Community score history - (regions x timesteps) arrays, one record per update
+        history_args = dict(every=HISTORY_EVERY, window=HISTORY_WINDOW, spill_dir=history_dir, chunk=HISTORY_SPILL_CHUNK)
+        self.pop_hist = HistoryBuffer(self.n, T_MAX_RANGE + 1, dtype=np.int32, name='pop', **history_args)
+        self.cmt_hist = HistoryBuffer(self.n, T_MAX_RANGE + 1, dtype=np.float64, name='cmt', **history_args)
+
+        # Nearest graph node of each centroid (see graph_handler.cached_centroid_nodes)
+        self.node_array = cached_centroid_nodes(self.g, centroids) if node_array is None else node_array
 
         # Amenity density and centroid distances
         self.amts_dens = amts_dens
         self.centroid_distances = centroid_distances
 
+        # Distance-decay weights of neighbouring regions in the community score (None = own region only)
+        self.community_kernel = build_community_kernel(centroid_distances)
+
         # Map GEO_ID to income
         self.geo_id_to_income = geo_id_to_income
 
@@ -48,38 +64,243 @@ class City:
         self.agts = agts  # list of agents
         self.agt_dows = np.array([a.dow for a in self.agts])  # array of agent endowments
 
+    def set_agt_arrays(self, agts):
+        """ Initialize agents from a struct-of-arrays engine (see AgentArrays.py) """
+        self.agts = agts  # agent engine
+        self.agt_dows = agts.dow  # array of agent endowments
+
+    def add_inhabitant(self, agent, index):
+        """ Move agent into centroid index, keeping region statistics current """
+        self.inh_array[index].add(agent)
+        self._add_dow(index, agent.dow)
+
+    def remove_inhabitant(self, agent, index):
+        """ Move agent out of centroid index, keeping region statistics current """
+        self.inh_array[index].remove(agent)
+        self._remove_dow(index, agent.dow)
+
+    def _add_dow(self, index, dow):
+        self.pop_array[index] += 1
+        self.dow_sum_array[index] += dow
+        insort(self.sorted_dows[index], dow)
+        self.dirty.add(index)
+
+    def _remove_dow(self, index, dow):
+        self.pop_array[index] -= 1
+        self.dow_sum_array[index] -= dow
+        dows = self.sorted_dows[index]
+        del dows[bisect_left(dows, dow)]
+        if not dows:
+            self.dow_sum_array[index] = 0.0  # Drop accumulated rounding error
+        self.dirty.add(index)
+
+    def load_arrays(self, positions, dows):
+        """
+        Rebuild the per-region endowment lists (as add_inhabitant keeps them) from position/endowment arrays,
+        for incremental moves; region scores and endowment sums must already match positions
+        (update_from_arrays or a restored checkpoint)
+        """
+        self.pop_array[:] = np.bincount(positions, minlength=self.n)
+        order = np.lexsort((dows, positions))  # grouped by region, ascending endowment
+        self.sorted_dows = [chunk.tolist() for chunk in np.split(dows[order], np.cumsum(self.pop_array)[:-1])]
+
+    def move_arrays(self, origins, destinations, dows):
+        """ Move agents given as origin/destination/endowment arrays (after load_arrays), then update() """
+        for origin, destination, dow in zip(origins.tolist(), destinations.tolist(), dows.tolist()):
+            if origin != destination:
+                self._remove_dow(origin, dow)
+                self._add_dow(destination, dow)
+
+    def add_arrays(self, positions, dows):
+        """ Add agents given as position/endowment arrays (after load_arrays), then update() """
+        for index, dow in zip(positions.tolist(), dows.tolist()):
+            self._add_dow(index, dow)
+
+    def remove_arrays(self, positions, dows):
+        """ Remove agents given as position/endowment arrays (after load_arrays), then update() """
+        for index, dow in zip(positions.tolist(), dows.tolist()):
+            self._remove_dow(index, dow)
+
     def update(self):
-        """ Update each centroid's: Population, CMT score, UPK score """
-        
-        for index in range(self.n):  # For each centroid
-            inhabitants = self.inh_array[index]  # Centroid inhabitants
-            pop = len(inhabitants)
+        """ Update each changed centroid's: CMT score, UPK score; record Population/CMT history """
 
-            self.pop_hist[index].append(pop) # Update population history
+        for index in self.dirty:  # For each centroid with arrivals or departures
+            pop = self.pop_array[index]
 
             if pop > 0:  # Inhabited
-                ''' Community Score ''' #(avg inhabitant dows, weighted by distance to other centroids) #TODO: check logic
-                inhabitant_dows = np.array([a.dow for a in inhabitants])  # Array of endowments of node's inhabitants
-                distances = self.centroid_distances[index, [a.u for a in inhabitants]]
-                weights = (1 - distances) ** 2
-
-                cmt = np.average(inhabitant_dows, weights=weights) #Calculate
+                ''' Community Score ''' #(avg inhabitant dows; distance weights to a region's own inhabitants are all 1)
+                cmt = self.dow_sum_array[index] / pop
+                self.avg_dow_array[index] = cmt
 
                 ''' Upkeep score '''
                 if pop < self.rho:
                     self.dow_thr_array[index] = 0.0
                 else:
-                    self.dow_thr_array[index] = np.partition(inhabitant_dows, -self.rho)[-self.rho]
+                    self.dow_thr_array[index] = self.sorted_dows[index][-self.rho]  # rho-th richest
                 self.upk_array[index] = 1.0
-                
+
             else:  # If uninhabited
                 self.dow_thr_array[index] = 0.0
                 self.upk_array[index] = 0.0
+                self.avg_dow_array[index] = 0.0
                 cmt = 0.0
 
-            # Update Community history and Community Score (average endowment)
-            self.cmt_hist[index].append(cmt)
+            # Update Community Score (average endowment)
             self.cmt_array[index] = cmt
+        self.dirty.clear()
+
+        # Neighbourhood Community Score (kernel-weighted average endowment of nearby regions)
+        if self.community_kernel is not None:
+            self.cmt_array[:] = smoothed_community(self.community_kernel, self.dow_sum_array, self.pop_array)
+
+        # Update Population and Community history
+        self.pop_hist.append(self.pop_array)
+        self.cmt_hist.append(self.cmt_array)
+
+    def update_from_arrays(self, positions, dows):
+        """ Vectorized update() from agent position/endowment arrays """
+        pop = np.bincount(positions, minlength=self.n)
+        dow_sums = np.bincount(positions, weights=dows, minlength=self.n)
+        self._update_from_stats(pop, dow_sums, self._rho_richest(positions, dows, pop))
+
+    def partial_stats(self, positions, dows):
+        """ Region statistics of one subset (shard) of the agents, for update_from_partials """
+        pop = np.bincount(positions, minlength=self.n)
+        dow_sums = np.bincount(positions, weights=dows, minlength=self.n)
+
+        # Each region's rho richest inhabitants within the subset (enough to find the rho-th richest overall)
+        order = np.lexsort((-dows, positions))  # grouped by region, richest first
+        starts = np.cumsum(pop) - pop
+        top = order[np.arange(len(order)) - starts[positions[order]] < self.rho]
+        return pop, dow_sums, positions[top], dows[top]
+
+    def update_from_partials(self, partials):
+        """ Vectorized update() from partial_stats() of disjoint agent subsets, reduced in their given order """
+        pop = np.zeros(self.n, dtype=int)
+        dow_sums = np.zeros(self.n)
+        for partial_pop, partial_dow_sums, _, _ in partials:
+            pop += partial_pop
+            dow_sums += partial_dow_sums
+        top_positions = np.concatenate([partial[2] for partial in partials])
+        top_dows = np.concatenate([partial[3] for partial in partials])
+        self._update_from_stats(pop, dow_sums, self._rho_richest(top_positions, top_dows))
+
+    def _rho_richest(self, positions, dows, pop=None):
+        """ Endowment of the rho-th richest inhabitant of each region with at least rho of them (else 0) """
+        pop = np.bincount(positions, minlength=self.n) if pop is None else pop
+        order = np.lexsort((-dows, positions))  # grouped by region, richest first
+        starts = np.cumsum(pop) - pop
+        full = pop >= self.rho
+        dow_thr = np.zeros(self.n)
+        dow_thr[full] = dows[order[starts[full] + self.rho - 1]]
+        return dow_thr
+
+    def update_from_cohorts(self, counts, dows):
+        """ Vectorized update() from inhabitant counts per (cohort, region) and cohort endowments """
+        pop = counts.sum(axis=0)
+        dow_sums = dows @ counts
+
+        # rho-th richest inhabitant of each full region: first (richest-first) cohort reaching rho inhabitants
+        order = np.argsort(-dows, kind='stable')
+        reached = np.cumsum(counts[order], axis=0) >= self.rho
+        full = pop >= self.rho
+        dow_thr = np.zeros(self.n)
+        dow_thr[full] = dows[order][np.argmax(reached, axis=0)[full]]
+
+        self._update_from_stats(pop, dow_sums, dow_thr)
+
+    def _update_from_stats(self, pop, dow_sums, dow_thr):
+        """ Region scores and history from population, endowment sums and endowment thresholds """
+        inhabited = pop > 0
+
+        ''' Community Score ''' # own-region mean endowment, or kernel-weighted over nearby regions (see community_kernel.py)
+        avg_dow = np.zeros(self.n)
+        avg_dow[inhabited] = dow_sums[inhabited] / pop[inhabited]
+        cmt = avg_dow if self.community_kernel is None else smoothed_community(self.community_kernel, dow_sums, pop)
+
+        ''' Upkeep score '''
+        self.dow_thr_array[:] = dow_thr
+        self.upk_array[:] = inhabited
+
+        self.pop_array[:] = pop
+        self.dow_sum_array[:] = dow_sums
+        self.avg_dow_array[:] = avg_dow
+        self.cmt_array[:] = cmt
+        self.pop_hist.append(pop)
+        self.cmt_hist.append(cmt)
+
+    # ==========
+    # CHECKPOINT
+    # ==========
+    def checkpoint_state(self):
+        """ Region scores and histories (agents/inhabitants are checkpointed by the agent engine) """
+        return {
+            'pop_array': self.pop_array.copy(),  # Benchmarks of a converged run are written without another step
+            'dow_thr_array': self.dow_thr_array.copy(),
+            'upk_array': self.upk_array.copy(),
+            'cmt_array': self.cmt_array.copy(),
+            'avg_dow_array': self.avg_dow_array.copy(),
+            'dow_sum_array': self.dow_sum_array.copy(),
+            'pop_hist': self.pop_hist.checkpoint_state(),
+            'cmt_hist': self.cmt_hist.checkpoint_state(),
+        }
+
+    def restore_checkpoint_state(self, state):
+        """ Restore region scores and histories; inhabitants must already be in place """
+        self.pop_array[:] = state['pop_array']
+        self.dow_thr_array[:] = state['dow_thr_array']
+        self.upk_array[:] = state['upk_array']
+        self.cmt_array[:] = state['cmt_array']
+        self.avg_dow_array[:] = state['avg_dow_array']
+        self.dow_sum_array[:] = state['dow_sum_array']
+        self.pop_hist.restore_checkpoint_state(state['pop_hist'])
+        self.cmt_hist.restore_checkpoint_state(state['cmt_hist'])
+        self.dirty.clear()
+
+    # ========
+    # SNAPSHOT
+    # ========
+    def snapshot_arrays(self, positions, avg_probabilities):
+        """ State arrays of a benchmark snapshot (see snapshot.py); never includes the graph. Changing arrays are copied """
+        return {
+            'rho': np.array(self.rho),
+            'lon_array': self.lon_array,
+            'lat_array': self.lat_array,
+            'name_array': np.array(self.name_array, dtype=str),
+            'id_array': np.array(self.id_array, dtype=str),
+            'beltline_score_array': self.beltline_score_array,
+            'amts_dens': np.asarray(self.amts_dens),
+            'income_ids': np.array(list(self.geo_id_to_income.keys()), dtype=str),
+            'income_values': np.array(list(self.geo_id_to_income.values()), dtype=float),
+            'pop_array': self.pop_array.copy(),
+            'avg_dow_array': self.avg_dow_array.copy(),
+            'dow_thr_array': self.dow_thr_array.copy(),
+            'upk_array': self.upk_array.copy(),
+            'cmt_array': self.cmt_array.copy(),
+            'agt_positions': np.array(positions),
+            'agt_dows': np.array(self.agt_dows),
+            'avg_probabilities': np.asarray(avg_probabilities, dtype=np.float32),
+        }
+
+    @classmethod
+    def from_snapshot(cls, arrays):
+        """ Rehydrate a (graph-less) City from snapshot arrays; enough for get_data() and plotting """
+        city = cls.__new__(cls)
+        city.rho = int(arrays['rho'])
+        city.centroids = None
+        city.g = None
+        city.n = len(arrays['id_array'])
+        city.lon_array = arrays['lon_array']
+        city.lat_array = arrays['lat_array']
+        city.name_array = arrays['name_array'].tolist()
+        city.id_array = arrays['id_array'].tolist()
+        city.beltline_score_array = arrays['beltline_score_array']
+        city.amts_dens = arrays['amts_dens']
+        city.geo_id_to_income = dict(zip(arrays['income_ids'].tolist(), arrays['income_values'].tolist()))
+        for name in ('pop_array', 'avg_dow_array', 'dow_thr_array', 'upk_array', 'cmt_array', 'agt_positions', 'agt_dows'):
+            setattr(city, name, arrays[name])
+        city.avg_probabilities = arrays.get('avg_probabilities')  # Stored in a separate file (see snapshot.load_snapshot)
+        return city
 
     # =====================
     # SAVE DATA TO CSV FILE
@@ -93,15 +314,8 @@ class City:
         """
         data = []  # Array storing data for each centroid
         
-        avg_incomes = np.zeros(self.n)
-        for index in range(self.n):
-            population = len(self.inh_array[index])
-            # Average Endowment
-            if population > 0:
-                avg_endowment = (np.mean([agent.dow for agent in self.inh_array[index]]))
-            else:
-                avg_endowment = 0.0
-            avg_incomes[index] = avg_endowment
+        # Average Endowment (kept current by update())
+        avg_incomes = self.avg_dow_array.copy()
 
         # Normalize avg_endowments
         min_val = avg_incomes.min()
@@ -118,7 +332,7 @@ class City:
             centroid_name = self.name_array[index]
 
             # Population
-            population = len(self.inh_array[index])
+            population = self.pop_array[index]
             
             avg_income = avg_incomes[index]
 
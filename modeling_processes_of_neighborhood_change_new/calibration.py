@@ -1,13 +1,15 @@
 # calibration.py
 
-from simulation import run_single_simulation_calibration
-from config import CTY_KEY, NUM_AGENTS, T_MAX_RANGE, viewData
-from helper import FIGURE_PKL_CACHE_DIR
+from simulation import run_single_simulation_calibration, run_ensemble_simulation_calibration
+from config import T_MAX_RANGE, SIMULATION_ENGINE, viewData
+from helper import FIGURE_PKL_CACHE_DIR, figure_key
+from snapshot import snapshot_path, load_snapshot
+from shared_inputs import SharedInputs
+from graph_handler import cached_centroid_nodes
 from pymoo.core.problem import Problem
 from pymoo.core.repair import Repair
 from joblib import Parallel, delayed
 import numpy as np
-import pickle
 
 class Calibration(Problem):
     def __init__(
@@ -17,9 +19,11 @@ class Calibration(Problem):
         g,
         amts_dens,
         centroid_distances,
-        assigned_routes,
+        route_tables,
         endowments,
-        n_jobs=-1
+        n_jobs=-1,
+        engine=SIMULATION_ENGINE,
+        node_array=None
         ):
         # n_var=2 [Rho, Alpha]
         # n_obj=1 # one objective: minimize income difference
@@ -37,16 +41,40 @@ class Calibration(Problem):
         self.g = g
         self.amts_dens = amts_dens
         self.centroid_distances = centroid_distances
-        self.assigned_routes = assigned_routes
+        self.route_tables = route_tables
         self.endowments = endowments
         self.n_jobs = n_jobs
+        self.engine = engine
+        self.node_array = node_array  # Nearest graph node of each centroid, snapped on first use if not given
+        self.shared = None  # Read-only inputs published for the workers, once for all generations
 
     def _evaluate(self, X, out, *args, **kwargs):
         # X is a 2D array of shape (population_size, 2)
         # We need to evaluate the objective for each row in X.
+
+        # Ensemble engine: simulate the whole generation's uncached parameters in one lock-step run
+        if self.engine == 'ensemble':
+            missing = list(dict.fromkeys(
+                (X[i, 0], X[i, 1]) for i in range(len(X))
+                if not snapshot_path(FIGURE_PKL_CACHE_DIR, figure_key(X[i, 0], X[i, 1], T_MAX_RANGE)).exists()
+            ))
+            if missing:
+                run_ensemble_simulation_calibration(
+                    missing,
+                    centroids=self.centroids,
+                    g=self.g,
+                    amts_dens=self.amts_dens,
+                    centroid_distances=self.centroid_distances,
+                    route_tables=self.route_tables,
+                    endowments=self.endowments,
+                    geo_id_to_income=self.geo_id_to_income,
+                    node_array=self.centroid_node_array()
+                )
         
+        # Workers attach to the shared inputs rather than unpickling a copy of this problem (graph included)
+        shared = self.shared_inputs()
         results = Parallel(n_jobs=self.n_jobs)(
-            delayed(self.get_error)(X[i, 0], X[i, 1], self.geo_id_to_income)
+            delayed(get_error)(shared, X[i, 0], X[i, 1], self.engine)
             for i in range(len(X))
         )
         
@@ -56,58 +84,78 @@ class Calibration(Problem):
             tot_diffs.append(diff)
         
         out["F"] = np.array(tot_diffs).reshape(-1,1)
-    
-    def get_error(self, rho, alpha, geo_id_to_income):
-        """ Return the total difference between the simulated and expected incomes of each region """
-        figkey = f"{CTY_KEY}_{rho}_{alpha}_{NUM_AGENTS}_{T_MAX_RANGE}"
-        pickle_path = FIGURE_PKL_CACHE_DIR / f"{figkey}.pkl"
-
-        # Check existence
-        if not pickle_path.exists():
-            _ = run_single_simulation_calibration(
-                    rho=rho,
-                    alpha=alpha,
-                    centroids=self.centroids,
-                    g=self.g,
-                    amts_dens=self.amts_dens,
-                    centroid_distances=self.centroid_distances,
-                    assigned_routes=self.assigned_routes,
-                    endowments=self.endowments,
-                    geo_id_to_income=self.geo_id_to_income
-                )
 
-        # Access city object
-        with open(pickle_path, 'rb') as file:
-            city = pickle.load(file)
+    def centroid_node_array(self):
+        """ Nearest graph node of each centroid, snapped on first use """
+        if self.node_array is None:
+            self.node_array = cached_centroid_nodes(self.g, self.centroids)
+        return self.node_array
 
-        # Fetch data
-        df_data = city.get_data()
-        df_data.set_index('Simulation_ID', inplace=True)
-        
-        # Use only geoid's existing in geo_id_to_income, & keep relevant columns
-        df_filtered = df_data.loc[geo_id_to_income.keys(), ['Avg Income', 'Expected Income']]
-        
-        # Remove rows where Expected income is NA
-        df_filtered = df_filtered.dropna(subset=['Expected Income'])
-        
-        # Extract arrays of expected and simulated incomes
-        simulated_income = df_filtered['Avg Income']
-        expected_income = df_filtered['Expected Income']
+    def shared_inputs(self):
+        """ Large read-only inputs, published on first use (see shared_inputs.py) """
+        if self.shared is None:
+            self.shared = SharedInputs.publish(
+                self.centroids, self.amts_dens, self.centroid_distances, self.centroid_node_array(),
+                self.route_tables, self.endowments, self.geo_id_to_income
+            )
+        return self.shared
+
+
+def get_error(shared, rho, alpha, engine=SIMULATION_ENGINE):
+    """ Return the total difference between the simulated and expected incomes of each region """
+    figkey = figure_key(rho, alpha, T_MAX_RANGE)
+    snapshot_file = snapshot_path(FIGURE_PKL_CACHE_DIR, figkey)
+    inputs = shared.attach()
+    geo_id_to_income = inputs.geo_id_to_income
+
+    # Check existence
+    if not snapshot_file.exists():
+        _ = run_single_simulation_calibration(
+                rho=rho,
+                alpha=alpha,
+                centroids=inputs.centroids,
+                g=None,
+                amts_dens=inputs.amts_dens,
+                centroid_distances=inputs.centroid_distances,
+                route_tables=inputs.route_tables,
+                endowments=inputs.endowments,
+                geo_id_to_income=geo_id_to_income,
+                engine=engine,
+                node_array=inputs.node_array
+            )
+
+    # Access city state
+    city = load_snapshot(snapshot_file)
+
+    # Fetch data
+    df_data = city.get_data()
+    df_data.set_index('Simulation_ID', inplace=True)
+    
+    # Use only geoid's existing in geo_id_to_income, & keep relevant columns
+    df_filtered = df_data.loc[geo_id_to_income.keys(), ['Avg Income', 'Expected Income']]
+    
+    # Remove rows where Expected income is NA
+    df_filtered = df_filtered.dropna(subset=['Expected Income'])
+    
+    # Extract arrays of expected and simulated incomes
+    simulated_income = df_filtered['Avg Income']
+    expected_income = df_filtered['Expected Income']
+
+    # Handle missing or invalid data (e.g., NaN values) in simulated_incomes
+    simulated_income = simulated_income.dropna()
 
-        # Handle missing or invalid data (e.g., NaN values) in simulated_incomes
-        simulated_income = simulated_income.dropna()
+    if viewData:
+        print(f"Number of rows in DataFrame: {df_filtered.shape[0]} after cleaning")
+        print("First 5 rows of simulated_income:")
+        print(simulated_income.head())
+        print("First 5 rows of expected_income:")
+        print(expected_income.head())
 
-        if viewData:
-            print(f"Number of rows in DataFrame: {df_filtered.shape[0]} after cleaning")
-            print("First 5 rows of simulated_income:")
-            print(simulated_income.head())
-            print("First 5 rows of expected_income:")
-            print(expected_income.head())
+    # Calculate total absolute difference
+    tot_difference = np.abs(expected_income - simulated_income).sum()
 
-        # Calculate total absolute difference
-        tot_difference = np.abs(expected_income - simulated_income).sum()
+    return tot_difference
 
-        return tot_difference
 
 class MyRepair(Repair):
     """ Manually choose how to round Rho and Alpha parameters """
@@ -0,0 +1,47 @@
+# candidates.py
+
+import numpy as np
+
+
+class CandidateSets:
+    """
+    Top-k candidate destinations: an agent starting in region o only ever considers the k regions nearest o
+    (by centroid distance, o itself first) plus num_explore random other regions, drawn once per agent.
+    Only the k nearest of each region are stored (regions x k); the exploration pool is every other region.
+    """
+
+    CHUNK_ROWS = 256  # Distance rows sorted at a time
+
+    def __init__(self, centroid_distances, k, num_explore=0):
+        distances = np.asarray(centroid_distances)
+        n = len(distances)
+        self.n = n
+        self.k = min(int(k), n)
+        self.num_explore = min(int(num_explore), n - self.k)
+        self.size = self.k + self.num_explore  # Candidates per agent
+
+        # k nearest regions of every region, nearest first (stable, so a region precedes equidistant ones)
+        self.nearest = np.empty((n, self.k), dtype=int)
+        for start in range(0, n, self.CHUNK_ROWS):
+            rows = np.arange(start, min(start + self.CHUNK_ROWS, n))
+            order = np.argsort(distances[rows], axis=1, kind='stable')
+            self_first = np.argsort(order != rows[:, None], axis=1, kind='stable')
+            self.nearest[rows] = np.take_along_axis(order, self_first, axis=1)[:, :self.k]
+
+        # Position of the j-th excluded (nearest) region among all regions, less j: the i-th region of the exploration
+        # pool (ascending) is i plus the number of these at most i
+        self.skips = np.sort(self.nearest, axis=1) - np.arange(self.k)
+
+    def draw(self, origins, rng):
+        """ Candidate regions (agents x size) of agents starting at origins """
+        origins = np.asarray(origins)
+        if not self.num_explore:
+            return self.nearest[origins].copy()
+
+        # One draw per equal stratum of the exploration pool, so the draws never repeat
+        pool = self.n - self.k
+        bounds = np.arange(self.num_explore + 1) * pool // self.num_explore
+        widths = np.diff(bounds)
+        explore = bounds[:-1] + (rng.random((len(origins), self.num_explore)) * widths).astype(int)
+        explore += (self.skips[origins][:, None, :] <= explore[:, :, None]).sum(axis=2)  # Pool index -> region
+        return np.concatenate((self.nearest[origins], explore), axis=1)
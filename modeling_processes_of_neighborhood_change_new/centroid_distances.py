@@ -2,8 +2,8 @@
 
 from config import N_JOBS
 from helper import CENTROID_DIST_CACHE_DIR
+from graph_handler import cached_centroid_nodes
 import os
-import osmnx as ox
 import networkx as nx
 import numpy as np
 from joblib import Parallel, delayed
@@ -19,7 +19,7 @@ def _hash(*args, **kwargs):
         hasher.update(pickle.dumps((key, value)))
     return hasher.hexdigest()
 
-def cached_centroid_distances(centroids, g, cache_dir=CENTROID_DIST_CACHE_DIR):
+def cached_centroid_distances(centroids, g, node_array=None, cache_dir=CENTROID_DIST_CACHE_DIR):
     """ Retrieve DISTANCES from cache or calculate for first time """
     # Create a unique hash for the current inputs
     centroids_coords = [(c[0], c[1]) for c in centroids]
@@ -32,20 +32,20 @@ def cached_centroid_distances(centroids, g, cache_dir=CENTROID_DIST_CACHE_DIR):
         print("Loading cached centroid distances.")
         distance_matrix = np.load(cache_path)
     else:
-        distance_matrix = compute_centroid_distances(centroids, g)
+        distance_matrix = compute_centroid_distances(centroids, g, node_array)
         np.save(cache_path, distance_matrix)
         print(f"Centroid distances cached.")
     
     return distance_matrix
 
-def compute_centroid_distances(centroids, g):
+def compute_centroid_distances(centroids, g, node_array=None):
     """ Perform calculations for centroid distances with multiprocessing"""
     print("Computing...")
     # Number of centroids
     n = len(centroids)
     
-    # Map centroids to nearest node
-    centroid_nodes = [ox.nearest_nodes(g, c[0], c[1]) for c in centroids]
+    # Map centroids to nearest node (one batched, cached query)
+    centroid_nodes = (cached_centroid_nodes(g, centroids) if node_array is None else node_array).tolist()
     
     # Initialize distance matrix
     distance_matrix = np.zeros((n, n))
@@ -0,0 +1,33 @@
+# checkpoint.py
+
+from config import EPSILON, WEIGHT_RENORM_THRESHOLD, WEIGHT_DTYPE, COMMUNITY_KERNEL_CUTOFF, COMMUNITY_KERNEL_SCALE, ROOT_SEED, NUM_AGENTS, COHORT_BINS, SPARSE_WEIGHTS, CANDIDATE_K, CANDIDATE_EXPLORE, UPDATE_SCHEDULE, UPDATE_FRACTION, UPDATE_RATE, INTRA_RUN_SHARDS, IMMIGRATION_RATE, EMIGRATION_RATE, POOL_CAPACITY, AGENT_BLOCK_SIZE, HISTORY_EVERY, HISTORY_WINDOW, HISTORY_SPILL_CHUNK, CONVERGENCE_WINDOW, CONVERGENCE_TOL
+from helper import CHECKPOINT_CACHE_DIR
+from hasher import hash_function
+import os
+import pickle
+
+
+def checkpoint_path(name, *fingerprint, cache_dir=CHECKPOINT_CACHE_DIR):
+    """ Checkpoint file for a run; any change to the fingerprinted configuration gives a new file """
+    settings = (EPSILON, WEIGHT_RENORM_THRESHOLD, WEIGHT_DTYPE, ROOT_SEED, NUM_AGENTS, COHORT_BINS, SPARSE_WEIGHTS, CANDIDATE_K, CANDIDATE_EXPLORE,
+                COMMUNITY_KERNEL_CUTOFF, COMMUNITY_KERNEL_SCALE,
+                UPDATE_SCHEDULE, UPDATE_FRACTION, UPDATE_RATE, INTRA_RUN_SHARDS, IMMIGRATION_RATE, EMIGRATION_RATE, POOL_CAPACITY, bool(AGENT_BLOCK_SIZE),
+                HISTORY_EVERY, HISTORY_WINDOW, HISTORY_SPILL_CHUNK, CONVERGENCE_WINDOW, CONVERGENCE_TOL)
+    return cache_dir / f"{name}_{hash_function(*settings, *fingerprint)}.pkl"
+
+
+def save_checkpoint(path, timestep, state):
+    """ Write state (arrays only - no graph, no City/Agent objects) reached after timestep """
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as file:
+        pickle.dump({'timestep': timestep, 'state': state}, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)  # Never leave a half-written checkpoint behind
+
+
+def load_checkpoint(path):
+    """ Return (timestep, state) of the last checkpoint, or (0, None) if there is none """
+    if not path.exists():
+        return 0, None
+    with open(path, 'rb') as file:
+        checkpoint = pickle.load(file)
+    return checkpoint['timestep'], checkpoint['state']
@@ -0,0 +1,29 @@
+# community_kernel.py
+
+from config import COMMUNITY_KERNEL_CUTOFF, COMMUNITY_KERNEL_SCALE
+from scipy import sparse
+import numpy as np
+
+
+def build_community_kernel(centroid_distances, cutoff=COMMUNITY_KERNEL_CUTOFF, scale=COMMUNITY_KERNEL_SCALE):
+    """
+    Sparse distance-decay kernel exp(-distance / scale) between regions at most cutoff apart (normalized distance),
+    built once per City; None if cutoff is 0 (community score = a region's own mean endowment)
+    """
+    if cutoff <= 0:
+        return None
+    distances = np.asarray(centroid_distances)
+    rows, cols = np.nonzero(distances <= cutoff)
+    weights = np.exp(-distances[rows, cols] / scale)
+    weights[rows == cols] = 1.0  # A region's own inhabitants always count fully
+    return sparse.csr_matrix((weights, (rows, cols)), shape=distances.shape)
+
+
+def smoothed_community(kernel, dow_sums, pop):
+    """ Kernel-weighted mean endowment around each region, O(nnz); 0 where no one lives within the cutoff """
+    weights = kernel @ pop
+    sums = kernel @ dow_sums
+    cmt = np.zeros(len(pop))
+    near = weights > 0
+    cmt[near] = sums[near] / weights[near]
+    return cmt
@@ -8,8 +8,36 @@ NUM_AGENTS = 500 # Number of agents
 HIGH_BLSCORE_METERS = 5000 # Radius for high Beltline score (greatly impacted areas)
 LOW_BLSCORE_METERS = 17500 # Radius for low Beltline score (too far to experience benefits)
 BENCHMARK_INTERVALS = 500 # Intervals (# timesteps) to capture frames of GIF
+CHECKPOINT_INTERVAL = 0 # Intervals (# timesteps) to checkpoint simulations for resuming/extending (0 = off; opt-in)
+SNAPSHOT_QUEUE_SIZE = 2 # Benchmark outputs queued for the background writer before the simulation waits (0 = write synchronously)
+HISTORY_EVERY = 1 # Record population/community history every k timesteps
+HISTORY_WINDOW = 0 # Keep only the last k history records (0 = keep all)
+HISTORY_SPILL_CHUNK = 0 # Spill history to 'cache/history' in chunks of k records (0 = keep in memory)
+CONVERGENCE_WINDOW = 0 # Window (# timesteps) over which to test for a steady state and stop early (0 = off)
+CONVERGENCE_TOL = 1e-3 # Relative change between consecutive windows below which a simulation counts as converged
 
 EPSILON = 1e-3 # Rate of learning
+WEIGHT_RENORM_THRESHOLD = 1e-6 # Rescale an agent's weights to sum to 1 once their sum decays below this, so long runs neither underflow nor lose precision (0 = never)
+WEIGHT_DTYPE = 'float64' # Per-agent weight arrays of the 'vectorized'/'ensemble' engines: 'float64' or 'float32' (half the memory and bandwidth; results depend on it)
+COMMUNITY_KERNEL_CUTOFF = 0.0 # Community score averages endowments of regions within this normalized distance (0 = own region only)
+COMMUNITY_KERNEL_SCALE = 0.1 # Decay length (normalized distance) of the community score's distance weights exp(-d / scale)
+ROOT_SEED = 0 # Root of all random streams; each run, replica and pipeline stage derives its own from it and a stable key
+
+SIMULATION_ENGINE = 'agent' # 'agent' (per-object Agent stepping), 'vectorized' (AgentArrays, all agents at once), 'ensemble' (all runs in lock-step in one process) or 'cohort' (income cohorts, for very large populations)
+ENSEMBLE_SEEDS = [None] # 'ensemble' engine: replicate seeds per (rho, alpha); None = the run's own stream, untagged file names
+UPDATE_SCHEDULE = 'all' # Agents moving per timestep: 'all', 'fraction' (UPDATE_FRACTION of them), 'poisson' (Poisson clocks at UPDATE_RATE) or 'single' (one random agent)
+UPDATE_FRACTION = 0.1 # 'fraction' schedule: share of agents moving per timestep
+UPDATE_RATE = 0.1 # 'poisson' schedule: expected moves per agent per timestep
+INTRA_RUN_SHARDS = 1 # 'vectorized' engine: split one run's agents into this many shards, stepped on parallel threads (1 = off; results depend on it)
+IMMIGRATION_RATE = 0.0 # Expected immigrants per timestep, as a share of NUM_AGENTS ('vectorized' engine; 0 = none)
+EMIGRATION_RATE = 0.0 # Probability that an agent leaves the city in a timestep ('vectorized' engine; 0 = none)
+POOL_CAPACITY = 2.0 # With migration: agent pool size as a multiple of NUM_AGENTS (immigrants are turned away once it is full)
+AGENT_BLOCK_SIZE = 0 # 'vectorized' engine: keep the agents x regions arrays in memory-mapped files ('cache/agent_state') and stream agents through each step in blocks of this many (0 = in memory)
+SPARSE_WEIGHTS = False # 'agent' engine: store each agent's weights as the shared amenity prior plus the regions it has visited (memory grows with visits, not regions)
+CANDIDATE_K = 0 # Top-k candidate mode ('agent'/'vectorized' engines): each agent only considers the k regions nearest its starting region (0 = all regions)
+CANDIDATE_EXPLORE = 5 # Top-k candidate mode: plus this many random other regions per agent, for exploration
+COHORT_BINS = 50 # 'cohort' engine: max number of endowment levels (agents with distinct endowments beyond this are pooled into quantile bins)
+PARTITION_BY = None # Simulate independent region partitions in parallel workers, each with its own compact distances and transport model, merged into the usual outputs: 'target' (one per ID_LIST target region), 'component' (per connected component of the graph) or None (one city)
 
 "-----------------------------------------------------------------------------------------------------------------------"
 """ Misc. Settings """
@@ -19,6 +47,7 @@ RUN_EXPERIMENTS = True  # RUN SIMULATION?
 RUN_CALIBRATION = False # RUN CALIBRATION?
 PLOT_CITIES = True      # PLOT SIMULATION?
 PLOT_FOLIUM = False        # Create Folium graph of t_max?
+STREAM_PLOTS = False    # Plot benchmarks and create GIFs while the simulations run (instead of afterwards)?
 viewData = False        # View GDF info + more?
 viewAmenityData = False # View amenity counts?
 
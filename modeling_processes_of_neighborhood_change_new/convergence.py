@@ -0,0 +1,80 @@
+# convergence.py
+
+import numpy as np
+
+
+class ConvergenceMonitor:
+    """
+    Detects a steady state from cheap per-step statistics, compared between consecutive windows of `window` steps:
+    - occupancy:    window-averaged regional population (relative L1 change)
+    - community:    window-averaged community score vector (relative L1 change)
+    - distribution: mean agent sampling distribution at the window boundaries (total variation distance)
+    The run has converged once all three fall below `tolerance` for `patience` consecutive windows.
+    """
+
+    def __init__(self, n, window, tolerance, patience=2):
+        self.window = int(window)
+        self.tolerance = tolerance
+        self.patience = patience
+
+        self.steps = 0  # steps observed in the current window
+        self.pop_sum = np.zeros(n)  # Running sums over the current window
+        self.cmt_sum = np.zeros(n)
+        self.prev = None  # (avg pop, avg cmt, mean distribution) of the previous window
+        self.streak = 0  # consecutive windows below tolerance
+        self.changes = None  # last (occupancy, community, distribution) changes
+
+    @staticmethod
+    def _relative_change(new, old):
+        scale = np.abs(old).sum()
+        return np.abs(new - old).sum() / scale if scale > 0 else float(np.abs(new).sum() > 0)
+
+    def observe(self, pop, cmt, mean_distribution):
+        """ Add one step's region statistics; mean_distribution() is only called at window boundaries. Returns True once converged """
+        self.pop_sum += pop
+        self.cmt_sum += cmt
+        self.steps += 1
+        if self.steps < self.window:
+            return False
+
+        current = (self.pop_sum / self.steps, self.cmt_sum / self.steps, np.asarray(mean_distribution()))
+        self.steps = 0
+        self.pop_sum[:] = 0.0
+        self.cmt_sum[:] = 0.0
+
+        if self.prev is not None:
+            self.changes = (
+                self._relative_change(current[0], self.prev[0]),
+                self._relative_change(current[1], self.prev[1]),
+                0.5 * np.abs(current[2] - self.prev[2]).sum(),
+            )
+            self.streak = self.streak + 1 if max(self.changes) < self.tolerance else 0
+        self.prev = current
+        return self.converged
+
+    @property
+    def converged(self):
+        return self.streak >= self.patience
+
+    def checkpoint_state(self):
+        return {
+            'steps': self.steps,
+            'pop_sum': self.pop_sum.copy(),
+            'cmt_sum': self.cmt_sum.copy(),
+            'prev': self.prev,
+            'streak': self.streak,
+            'changes': self.changes,
+        }
+
+    def restore_checkpoint_state(self, state):
+        self.steps = state['steps']
+        self.pop_sum[:] = state['pop_sum']
+        self.cmt_sum[:] = state['cmt_sum']
+        self.prev = state['prev']
+        self.streak = state['streak']
+        self.changes = state['changes']
+
+
+def all_converged(monitors):
+    """ True if convergence monitoring is on and every monitor has converged """
+    return bool(monitors) and all(monitor.converged for monitor in monitors)
@@ -3,11 +3,14 @@
 import numpy as np
 from config import NUM_AGENTS, ECONOMIC_URL, ECONOMIC_DATA_SKIP_ROWS, ECONOMIC_DATA_COL, POPULATION_URL, POPULATION_DATA_COL,  POPULATION_DATA_SKIP_ROWS
 from file_download_manager import download_and_extract_census_data
+from random_streams import make_rng
 import pandas as pd
 
 incomes = np.array([])
 
-def economic_distribution():
+def economic_distribution(rng=None):
+    rng = make_rng('economic_distribution') if rng is None else rng
+
     # [INCOME]
     income_data = download_and_extract_census_data(ECONOMIC_URL, 'economic_data.zip', 'economic_data')
     income_df = pd.read_csv(income_data, skiprows=ECONOMIC_DATA_SKIP_ROWS, header=0)
@@ -29,7 +32,7 @@ def economic_distribution():
     probabilities = populations / populations.sum()
     
     # Endowments array, length len(NUM_AGENTS)
-    endowments = np.random.choice(incomes, size=NUM_AGENTS, p=probabilities)
+    endowments = rng.choice(incomes, size=NUM_AGENTS, p=probabilities)
     
     # Map GEO_ID to income
     #truncate ID's from income spreadsheet
@@ -5,8 +5,10 @@ from collections import defaultdict
 import networkx as nx
 import numpy as np
 
+from random_streams import make_rng
 
-def generate_trips(centroids, amts_dens, base_trips=100):
+
+def generate_trips(centroids, amts_dens, base_trips=100, rng=None):
     """
     Estimate trip generation based on amenity scores.
 
@@ -14,10 +16,12 @@ def generate_trips(centroids, amts_dens, base_trips=100):
     centroids (list): List of (lon, lat, region_name, in_beltline, geoid)
     amts_dens (list): List of amenity scores for each zone
     base_trips (int): Base number of trips to scale by amenity scores
+    rng (numpy.random.Generator): Random stream (default: derived from ROOT_SEED)
 
     Returns:
     dict: Dictionary mapping geoid to number of generated trips
     """
+    rng = make_rng('generate_trips') if rng is None else rng
     trip_counts = {}
     # Normalize amenity scores to sum to 1 for use as probabilities
     total_amenity_score = sum(amts_dens)
@@ -25,7 +29,7 @@ def generate_trips(centroids, amts_dens, base_trips=100):
 
     for idx, (_, _, _, _, geoid) in enumerate(centroids):
         # Generate trips based on amenity score probability
-        trip_counts[geoid] = np.random.poisson(lam=base_trips * amenity_probabilities[idx])
+        trip_counts[geoid] = rng.poisson(lam=base_trips * amenity_probabilities[idx])
 
     return trip_counts
 
@@ -161,7 +165,7 @@ def route_assignment(split_distribution, g):
     return dict(assigned_routes)
 
 
-def run_four_step_model(centroids, g, amts_dens, centroid_distances, base_trips=100, car_ownership_rate=0.7):
+def run_four_step_model(centroids, g, amts_dens, centroid_distances, base_trips=100, car_ownership_rate=0.7, rng=None):
     """
     Run the complete four-step transportation model.
 
@@ -172,12 +176,13 @@ def run_four_step_model(centroids, g, amts_dens, centroid_distances, base_trips=
     centroid_distances (dict): Dictionary of distances between centroids
     base_trips (int): Base number of trips to scale by amenity scores
     car_ownership_rate (float): Proportion of trips made by car
+    rng (numpy.random.Generator): Random stream for trip generation (default: derived from ROOT_SEED)
 
     Returns:
     tuple: (trip_counts, trip_distribution, split_distribution, assigned_routes)
     """
     # Step 1: Trip Generation
-    trip_counts = generate_trips(centroids, amts_dens, base_trips)
+    trip_counts = generate_trips(centroids, amts_dens, base_trips, rng=rng)
 
     # Step 2: Trip Distribution
     trip_distribution = distribute_trips(trip_counts, centroids, amts_dens, centroid_distances)
@@ -188,4 +193,74 @@ def run_four_step_model(centroids, g, amts_dens, centroid_distances, base_trips=
     # Step 4: Route Assignment
     assigned_routes = route_assignment(split_distribution, g)
 
-    return trip_counts, trip_distribution, split_distribution, assigned_routes
\ No newline at end of file
+    return trip_counts, trip_distribution, split_distribution, assigned_routes
+
+# Mode -> row block of the compiled route tables
+ROUTE_MODES = ('car', 'transit')
+
+
+class RouteTables:
+    """
+    Route assignment compiled into per-(origin, mode) destination sampling tables.
+
+    Row r = mode_index * n + origin_index holds its destinations in
+    dest_indices[offsets[r]:offsets[r + 1]], with integer route volumes in volumes.
+    """
+
+    def __init__(self, n, offsets, dest_indices, volumes):
+        self.n = n  # num centroids
+        self.offsets = offsets
+        self.dest_indices = dest_indices
+        self.volumes = volumes
+
+    def row(self, origin_idx, mode):
+        """ Row index of an (origin, mode) pair """
+        return ROUTE_MODES.index(mode) * self.n + origin_idx
+
+    def lookup(self, origin_idx, mode):
+        """ (destination indices, volumes) of routes leaving origin_idx by mode """
+        r = self.row(origin_idx, mode)
+        start, end = self.offsets[r], self.offsets[r + 1]
+        return self.dest_indices[start:end], self.volumes[start:end]
+
+    def dense(self):
+        """ (len(ROUTE_MODES) * n, n) volume matrix, for the vectorized engine """
+        table = np.zeros((len(ROUTE_MODES) * self.n, self.n))
+        rows = np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))
+        table[rows, self.dest_indices] = self.volumes
+        return table
+
+
+def compile_route_tables(assigned_routes, centroids):
+    """
+    Compile assigned routes once into indexed per-(origin, mode) sampling tables.
+
+    Parameters:
+    assigned_routes (dict): {(origin_geoid, dest_geoid, mode): volume or {'volume', 'path'}}
+    centroids (list): List of centroid data (lon, lat, region_name, in_beltline, geoid)
+
+    Returns:
+    RouteTables: Destination indices and integer volumes per (origin, mode)
+    """
+    n = len(centroids)
+    geoid_to_index = {centroid[4]: idx for idx, centroid in enumerate(centroids)}
+
+    # Accumulate integer volumes per (row, destination)
+    volumes_by_key = defaultdict(int)
+    for (o_geoid, d_geoid, mode), route in (assigned_routes or {}).items():
+        if o_geoid not in geoid_to_index or d_geoid not in geoid_to_index or mode not in ROUTE_MODES:
+            continue
+        volume = int(route['volume'] if isinstance(route, dict) else route)
+        if volume > 0:
+            row = ROUTE_MODES.index(mode) * n + geoid_to_index[o_geoid]
+            volumes_by_key[(row, geoid_to_index[d_geoid])] += volume
+
+    # Sort by row, then destination, into CSR-style arrays
+    keys = sorted(volumes_by_key)
+    rows = np.array([row for row, _ in keys], dtype=int)
+    dest_indices = np.array([dest for _, dest in keys], dtype=int)
+    volumes = np.array([volumes_by_key[key] for key in keys], dtype=float)
+    offsets = np.zeros(len(ROUTE_MODES) * n + 1, dtype=int)
+    np.cumsum(np.bincount(rows, minlength=len(ROUTE_MODES) * n), out=offsets[1:])
+
+    return RouteTables(n, offsets, dest_indices, volumes)
@@ -46,16 +46,19 @@ def create_gif(key, file_tuples, duration, num_pause_frames, output_directory):
         all_images.extend(images)
 
     if all_images:
-        # Add back prefix
-        example_filename = os.path.basename(pdf_files[0])
-        prefix = "_".join(example_filename.split("_")[:-5])
-        
-        output_gif = os.path.join(output_directory, f"{prefix}_{'_'.join(key)}.gif")
+        output_gif = os.path.join(output_directory, f"{'_'.join(key)}.gif")
         images_to_gif(all_images, output_gif, duration=duration, num_pause_frames=num_pause_frames)
         print(f"Created GIF: {output_gif}")
     else:
         print(f"No images found for group: {key}")
         
+def gif_group(filename):
+    """ GIF key (prefix, rho, alpha, num agents) and frame number (timestep) of a plot PDF's filename """
+    parts = filename.replace(".pdf", "").split("_")
+    X, Y, Z, NUM = parts[-5:-1]
+    prefix = "_".join(parts[:-5])  # CTY_KEY, with seed tag for ensemble replicates
+    return (prefix, X, Y, Z), int(NUM)
+
 # Multiprocessing based on image groupings
 def process_pdfs_to_gifs(pdf_directory, output_directory, duration, num_pause_frames):
     """ Processes all PDFs in a directory, call create_gif for multiprocessing """
@@ -63,10 +66,8 @@ def process_pdfs_to_gifs(pdf_directory, output_directory, duration, num_pause_fr
     groups = defaultdict(list)
     for filename in os.listdir(pdf_directory):
         if filename.endswith(".pdf"):
-            parts = filename.replace(".pdf", "").split("_")
-            X, Y, Z, NUM = parts[-5:-1]
-            key = (X, Y, Z)
-            groups[key].append((int(NUM), os.path.join(pdf_directory, filename)))
+            key, NUM = gif_group(filename)
+            groups[key].append((NUM, os.path.join(pdf_directory, filename)))
     
     Parallel(n_jobs=N_JOBS, backend='loky')(
             delayed(create_gif)(
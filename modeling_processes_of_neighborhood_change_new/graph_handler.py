@@ -2,6 +2,7 @@
 
 import osmnx as ox
 import networkx as nx
+import numpy as np
 import pickle
 import os
 from helper import GRAPH_CACHE_DIR
@@ -53,4 +54,31 @@ def load_graph(layer_urls, cache_dir=GRAPH_CACHE_DIR):
         return g
     except:
         print("[load_graph] File not found.")
-        return None
\ No newline at end of file
+        return None
+
+# ==============================
+# CENTROID -> NEAREST GRAPH NODE
+# ==============================
+
+def graph_fingerprint(g):
+    """ Fingerprint of a graph's nodes and their coordinates """
+    nodes, xs, ys = zip(*((node, data['x'], data['y']) for node, data in g.nodes(data=True)))
+    return hash_function(np.array(nodes), np.array(xs), np.array(ys))
+
+def snap_points(g, lons, lats):
+    """ Nearest graph node of every point, in one spatial-index query """
+    return np.asarray(ox.nearest_nodes(g, X=np.asarray(lons, dtype=float), Y=np.asarray(lats, dtype=float)))
+
+def cached_centroid_nodes(g, centroids, cache_dir=GRAPH_CACHE_DIR):
+    """ Retrieve the centroids' nearest graph nodes from cache or snap them for first time """
+    lons = [c[0] for c in centroids]
+    lats = [c[1] for c in centroids]
+    cache_key = f"centroid_nodes_{hash_function(graph_fingerprint(g), lons, lats)}.npy"
+    cache_path = os.path.join(cache_dir, cache_key)
+
+    if os.path.exists(cache_path):
+        return np.load(cache_path)
+
+    node_array = snap_points(g, lons, lats)
+    np.save(cache_path, node_array)
+    return node_array
@@ -1,5 +1,5 @@
 # helper.py
-from config import ZIP_URLS, T_MAX_RANGE, BENCHMARK_INTERVALS, HIGH_BLSCORE_METERS, LOW_BLSCORE_METERS
+from config import ZIP_URLS, T_MAX_RANGE, BENCHMARK_INTERVALS, HIGH_BLSCORE_METERS, LOW_BLSCORE_METERS, CTY_KEY, NUM_AGENTS
 from pathlib import Path
 import os
 import numpy as np
@@ -19,6 +19,10 @@ AMTS_DENS_CACHE_DIR = CACHE_DIR / 'amts_dens'
 CENTROID_DIST_CACHE_DIR = CACHE_DIR / 'centroid_distances'
 OSMNX_CACHE_DIR = CACHE_DIR / 'osmnx_cache'
 FIGURE_PKL_CACHE_DIR = CACHE_DIR / 'pkl_figures'
+CHECKPOINT_CACHE_DIR = CACHE_DIR / 'checkpoints'
+HISTORY_CACHE_DIR = CACHE_DIR / 'history'
+AGENT_STATE_CACHE_DIR = CACHE_DIR / 'agent_state'
+SHARED_INPUTS_CACHE_DIR = CACHE_DIR / 'shared_inputs'
 GDF_CACHE_DIR = CACHE_DIR / 'gdfs'
 LAYER_CACHE_DIR = CACHE_DIR / 'layers'
 SAVED_DIR = CACHE_DIR / 'saved'
@@ -28,7 +32,8 @@ def create_required_directories():
     for directory in [
         SAVED_DIR, FOLIUM_DIR, PLT_DIR, GIFS_CACHE_DIR, GRAPH_CACHE_DIR,
         LAYER_CACHE_DIR, GDF_CACHE_DIR, CACHE_DIR, DATA_DIR, FIGURES_DIR, AMTS_DENS_CACHE_DIR, 
-        CENTROID_DIST_CACHE_DIR, OSMNX_CACHE_DIR, FIGURE_PKL_CACHE_DIR, CENSUS_DATA_CACHE_DIR
+        CENTROID_DIST_CACHE_DIR, OSMNX_CACHE_DIR, FIGURE_PKL_CACHE_DIR, CENSUS_DATA_CACHE_DIR, CHECKPOINT_CACHE_DIR,
+        HISTORY_CACHE_DIR, AGENT_STATE_CACHE_DIR, SHARED_INPUTS_CACHE_DIR
     ]:
         os.makedirs(directory, exist_ok=True)
     
@@ -36,6 +41,15 @@ def create_required_directories():
 num_benchmarks = int(T_MAX_RANGE/BENCHMARK_INTERVALS)
 T_MAX_L = np.linspace(BENCHMARK_INTERVALS, T_MAX_RANGE, num_benchmarks, dtype=int)
 
+""" Simulation output key; replicate seeds (ensemble engine) are tagged onto the prefix """
+def figure_key(rho, alpha, t_max, seed=None):
+    prefix = CTY_KEY if seed is None else f"{CTY_KEY}-seed{seed}"
+    return f"{prefix}_{rho}_{alpha}_{NUM_AGENTS}_{t_max}"
+
+""" Output key of one region partition, until its outputs are merged (see partitions.py) """
+def partition_key(figkey, partition):
+    return f"{figkey}_partition{partition}"
+
 """ Create list of MAX_BLSCORE_METERS and LOW_BLSCORE_METERS """
 BLMETERS_LIST = []
 BLMETERS_LIST.append(HIGH_BLSCORE_METERS)
@@ -0,0 +1,115 @@
+# history.py
+
+import numpy as np
+
+
+class HistoryBuffer:
+    """
+    Preallocated (regions x records) history of a per-region value, one record per append().
+
+    every:     keep one record every `every` appends (temporal downsampling)
+    window:    keep only the last `window` records (rolling ring buffer)
+    spill_dir: write full chunks of `chunk` records to disk as .npy files, keeping one chunk in memory
+    """
+
+    def __init__(self, n, capacity, dtype=float, every=1, window=0, spill_dir=None, chunk=0, name='history'):
+        self.n = n  # num regions
+        self.every = max(int(every), 1)
+        self.window = int(window)
+        self.spill_dir = spill_dir if chunk else None
+        self.name = name
+
+        self.steps = 0  # append() calls so far
+        self.num_records = 0  # records taken so far (including spilled or overwritten ones)
+        self.fill = 0  # records in the in-memory buffer (unused in window mode)
+        self.num_chunks = 0  # chunks spilled to disk
+
+        if self.window:
+            size = self.window
+        elif self.spill_dir is not None:
+            size = int(chunk)
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+        else:
+            size = max(-(-int(capacity) // self.every), 1)
+        self.buffer = np.zeros((n, size), dtype=dtype)
+
+    def append(self, values):
+        """ Record one timestep's per-region values """
+        step = self.steps
+        self.steps += 1
+        if step % self.every:
+            return
+
+        if self.window:
+            self.buffer[:, self.num_records % self.window] = values
+        else:
+            if self.fill == self.buffer.shape[1]:
+                if self.spill_dir is not None:
+                    self._spill()
+                else:
+                    self._grow()
+            self.buffer[:, self.fill] = values
+            self.fill += 1
+        self.num_records += 1
+
+    def _chunk_path(self, k):
+        return self.spill_dir / f"{self.name}_{k}.npy"
+
+    def _spill(self):
+        """ Write the full in-memory chunk to disk and start a new one """
+        np.save(self._chunk_path(self.num_chunks), self.buffer)
+        self.num_chunks += 1
+        self.fill = 0
+
+    def _grow(self):
+        """ Double capacity (only if a run outgrows its preallocated horizon, e.g. when extended) """
+        grown = np.zeros((self.n, 2 * self.buffer.shape[1]), dtype=self.buffer.dtype)
+        grown[:, :self.fill] = self.buffer[:, :self.fill]
+        self.buffer = grown
+
+    def __len__(self):
+        """ Number of retained records """
+        if self.window:
+            return min(self.num_records, self.window)
+        return self.num_chunks * self.buffer.shape[1] + self.fill
+
+    def array(self):
+        """ Retained history as a (regions x records) array, oldest record first """
+        if self.window:
+            if self.num_records < self.window:
+                return self.buffer[:, :self.num_records]
+            start = self.num_records % self.window
+            return np.concatenate((self.buffer[:, start:], self.buffer[:, :start]), axis=1)
+        chunks = [np.load(self._chunk_path(k), mmap_mode='r') for k in range(self.num_chunks)]
+        return np.concatenate(chunks + [self.buffer[:, :self.fill]], axis=1)
+
+    def timesteps(self):
+        """ Update index (0 = initial update) of each retained record """
+        first = self.num_records - len(self)
+        return (first + np.arange(len(self))) * self.every
+
+    def __getitem__(self, index):
+        """ History of one region (or any numpy index over regions) """
+        return self.array()[index]
+
+    def checkpoint_state(self):
+        """ Counters and in-memory records (spilled chunks stay on disk) """
+        used = self.buffer.shape[1] if self.window else self.fill
+        return {
+            'steps': self.steps,
+            'num_records': self.num_records,
+            'fill': self.fill,
+            'num_chunks': self.num_chunks,
+            'buffer': self.buffer[:, :used].copy(),
+        }
+
+    def restore_checkpoint_state(self, state):
+        """ Restore from checkpoint_state() """
+        self.steps = state['steps']
+        self.num_records = state['num_records']
+        self.fill = state['fill']
+        self.num_chunks = state['num_chunks']
+        records = state['buffer']
+        while records.shape[1] > self.buffer.shape[1]:
+            self._grow()
+        self.buffer[:, :records.shape[1]] = records
@@ -2,24 +2,26 @@
 
 from collections import defaultdict
 from helper import create_required_directories, GDF_CACHE_FILENAME, GIFS_CACHE_DIR, PLT_DIR, T_MAX_L, SAVED_IDS_FILE, SAVED_BLMETERS_FILE, BLMETERS_LIST, SAVED_LAYER_URLS_FILE, LAYER_CACHE_DIR, ZIP_URLS
-from config import RUN_CALIBRATION, CTY_KEY, NUM_AGENTS, T_MAX_RANGE, PLOT_CITIES, RHO_L, ALPHA_L, AMENITY_TAGS, N_JOBS, GIF_NUM_PAUSE_FRAMES, GIF_FRAME_DURATION, ID_LIST, RELATION_IDS, viewData
+from config import RUN_CALIBRATION, CTY_KEY, NUM_AGENTS, T_MAX_RANGE, PLOT_CITIES, STREAM_PLOTS, RHO_L, ALPHA_L, AMENITY_TAGS, N_JOBS, GIF_NUM_PAUSE_FRAMES, GIF_FRAME_DURATION, ID_LIST, RELATION_IDS, SIMULATION_ENGINE, ENSEMBLE_SEEDS, PARTITION_BY, viewData
 from file_download_manager import download_and_extract_layers_all
 from economic_distribution import economic_distribution
 from gdf_handler import load_gdf, create_gdf, print_overlaps
-from graph_handler import load_graph, create_graph, save_graph
+from graph_handler import load_graph, create_graph, save_graph, cached_centroid_nodes
 from amtdens import compute_amts_dens
 from centroid_distances import cached_centroid_distances
 from simulation import run_simulation
+from partitions import region_partitions, run_partitioned_simulation
 from visualization import plot_city
 from gif import process_pdfs_to_gifs
+from pipeline import stream_outputs
 from centroids import create_centroids
 from save_values import save_current_values, load_previous_values
 from calibration import Calibration, MyRepair
 from beltline_score import fetch_beltline_nodes
 from pathlib import Path
 from itertools import product
-from joblib import Parallel, delayed
-from four_step_model import run_four_step_model
+from joblib import Parallel, delayed, effective_n_jobs
+from four_step_model import run_four_step_model, compile_route_tables
 from pymoo.algorithms.soo.nonconvex.ga import GA
 from pymoo.termination import get_termination
 from pymoo.optimize import minimize
@@ -204,7 +206,14 @@ def main():
     distances_start_time = time.time()
     print("Processing centroid distances...")
 
-    centroid_distances = cached_centroid_distances(centroids, g)
+    node_array = cached_centroid_nodes(g, centroids)  # Nearest graph node of each centroid, snapped once
+
+    # Partitions compute their own compact distances and transport model; calibration still needs the whole city's
+    partitions = region_partitions(PARTITION_BY, num_geometries_individual, g, node_array) if PARTITION_BY else None
+    full_inputs = partitions is None or RUN_CALIBRATION
+    if partitions is not None:
+        print(f"Split {len(centroids)} regions into {len(partitions)} partitions (by {PARTITION_BY}).")
+    centroid_distances = cached_centroid_distances(centroids, g, node_array) if full_inputs else None
 
     distances_end_time = time.time()
     print(f"Completed distance initialization after {distances_end_time - distances_start_time:.2f} seconds.\n")
@@ -212,46 +221,73 @@ def main():
     # ========================
     # RUN TRANSPORTATION MODEL
     # ========================
-    transport_start_time = time.time()
-    print("Running transportation model...")
-
-    trip_counts, trip_distribution, split_distribution, assigned_routes = run_four_step_model(
-        centroids=centroids,
-        g=g,
-        amts_dens=amts_dens,
-        centroid_distances=centroid_distances,
-        base_trips=100,
-        car_ownership_rate=0.7
-    )
+    route_tables = None
+    if full_inputs:
+        transport_start_time = time.time()
+        print("Running transportation model...")
+
+        trip_counts, trip_distribution, split_distribution, assigned_routes = run_four_step_model(
+            centroids=centroids,
+            g=g,
+            amts_dens=amts_dens,
+            centroid_distances=centroid_distances,
+            base_trips=100,
+            car_ownership_rate=0.7
+        )
+        route_tables = compile_route_tables(assigned_routes, centroids)
 
-    transport_end_time = time.time()
-    print(f"Completed transportation model after {transport_end_time - transport_start_time:.2f} seconds.\n")
+        transport_end_time = time.time()
+        print(f"Completed transportation model after {transport_end_time - transport_start_time:.2f} seconds.\n")
 
     # ==============
     # RUN SIMULATION
     # ==============
     simulation_start_time = time.time()
-    print("Simulating...")
+    seeds = ENSEMBLE_SEEDS if SIMULATION_ENGINE == 'ensemble' else [None]
+    simulation_params = list(product(RHO_L, ALPHA_L, T_MAX_L, seeds))
+    num_runs = 1 if SIMULATION_ENGINE == 'ensemble' else len(RHO_L) * len(ALPHA_L)  # Parallel simulation tasks (ensemble: one)
+    if partitions is not None:
+        num_runs *= len(partitions)
+        simulate = lambda: run_partitioned_simulation(centroids, g, amts_dens, node_array, endowments, geo_id_to_income, partitions)
+    else:
+        simulate = lambda: run_simulation(centroids, g, amts_dens, centroid_distances, route_tables, endowments, geo_id_to_income, node_array=node_array)
 
-    run_simulation(centroids, g, amts_dens, centroid_distances, assigned_routes, endowments, geo_id_to_income)
+    if PLOT_CITIES and STREAM_PLOTS:
+        # Plot each benchmark as soon as it is written, and each GIF as soon as its last frame is plotted
+        print("Simulating, plotting and creating GIF(s)...")
 
-    simulation_end_time = time.time()
-    print(f"Completed simulation(s) after {simulation_end_time - simulation_start_time:.2f} seconds.\n")
+        stream_outputs(
+            simulate,
+            centroids,
+            simulation_params,
+            GIFS_CACHE_DIR,
+            duration=GIF_FRAME_DURATION,
+            num_pause_frames=GIF_NUM_PAUSE_FRAMES,
+            simulation_workers=min(effective_n_jobs(N_JOBS), num_runs),
+        )
+
+        simulation_end_time = time.time()
+        print(f"Completed simulation(s), plotting and GIF's after {simulation_end_time - simulation_start_time:.2f} seconds.\n")
+    else:
+        print("Simulating...")
+
+        simulate()
+
+        simulation_end_time = time.time()
+        print(f"Completed simulation(s) after {simulation_end_time - simulation_start_time:.2f} seconds.\n")
 
     # ==============================
     # VISUALIZATION LOGIC (PLOTTING)
     # ==============================
-    if PLOT_CITIES:
+    if PLOT_CITIES and not STREAM_PLOTS:
         plot_start_time = time.time() 
         print("Plotting...")
 
-        simulation_params = list(product(RHO_L, ALPHA_L, T_MAX_L))
-
         Parallel(n_jobs=N_JOBS, backend='loky')(
             delayed(plot_city)(
-                rho, alpha, t_max, centroids
+                rho, alpha, t_max, centroids, seed
             )
-            for rho, alpha, t_max in simulation_params
+            for rho, alpha, t_max, seed in simulation_params
         )
 
         plot_end_time = time.time()
@@ -280,8 +316,9 @@ def main():
             g,
             amts_dens,
             centroid_distances,
-            assigned_routes,
+            route_tables,
             endowments,
+            node_array=node_array,
         )
         algorithm = GA(
             pop_size=50,  # Number of parameter combinations to test
@@ -0,0 +1,148 @@
+# partitions.py
+
+from config import RHO_L, ALPHA_L, RUN_EXPERIMENTS, N_JOBS, SIMULATION_ENGINE, ENSEMBLE_SEEDS
+from helper import DATA_DIR, FIGURE_PKL_CACHE_DIR, T_MAX_L, figure_key, partition_key
+from centroid_distances import cached_centroid_distances
+from four_step_model import run_four_step_model, compile_route_tables
+from random_streams import make_rng
+from shared_inputs import SharedInputs
+from simulation import SimulationManager
+from snapshot import snapshot_path, probabilities_path, probabilities_buffer, load_probabilities, write_benchmark
+from itertools import product
+from joblib import Parallel, delayed
+import networkx as nx
+import numpy as np
+
+# Per-region snapshot arrays (see City.snapshot_arrays), merged in global region order
+REGION_ARRAYS = ('lon_array', 'lat_array', 'name_array', 'id_array', 'beltline_score_array', 'amts_dens',
+                 'pop_array', 'avg_dow_array', 'dow_thr_array', 'upk_array', 'cmt_array')
+
+
+def region_partitions(partition_by, num_geometries_individual, g, node_array):
+    """
+    Split the regions (centroid indices) into independent partitions: 'target' gives one per ID_LIST target region
+    (gdf_handler.within_gdf stacks their regions in that order), 'component' one per connected component of the graph
+    """
+    if partition_by == 'target':
+        bounds = np.cumsum(num_geometries_individual)[:-1]
+        return [indices for indices in np.split(np.arange(len(node_array)), bounds) if len(indices)]
+    if partition_by == 'component':
+        components = nx.weakly_connected_components(g) if g.is_directed() else nx.connected_components(g)
+        nodes = node_array.tolist()
+        centroid_nodes = set(nodes)
+        component_of = {}
+        for k, component in enumerate(components):
+            for node in centroid_nodes.intersection(component):
+                component_of[node] = k
+
+        # Partitions in order of their first region
+        groups = {}
+        for i, node in enumerate(nodes):
+            groups.setdefault(component_of[node], []).append(i)
+        return [np.array(indices) for indices in groups.values()]
+    raise ValueError(f"Unknown partitioning '{partition_by}'")
+
+
+def split_endowments(endowments, partitions, rng=None):
+    """ Endowments of each partition's agents: a random share of the population, in proportion to its regions """
+    rng = make_rng('partitions') if rng is None else rng
+    sizes = np.array([len(indices) for indices in partitions])
+    quotas = len(endowments) * sizes / sizes.sum()
+    counts = np.floor(quotas).astype(int)
+    counts[np.argsort(counts - quotas)[:len(endowments) - counts.sum()]] += 1  # Largest remainders
+    shuffled = rng.permutation(np.asarray(endowments, dtype=float))
+    return np.split(shuffled, np.cumsum(counts)[:-1])
+
+
+def publish_partition(k, indices, centroids, g, amts_dens, node_array, endowments, geo_id_to_income):
+    """ Compact inputs of partition k: its regions' centroids, amenities and distances, and its own transport model """
+    centroids = [centroids[i] for i in indices]
+    amts_dens = np.asarray(amts_dens)[indices]
+    node_array = np.asarray(node_array)[indices]
+    centroid_distances = cached_centroid_distances(centroids, g, node_array)
+    _, _, _, assigned_routes = run_four_step_model(
+        centroids=centroids,
+        g=g,
+        amts_dens=amts_dens,
+        centroid_distances=centroid_distances,
+        base_trips=100,
+        car_ownership_rate=0.7,
+        rng=make_rng('generate_trips', 'partition', k),
+    )
+    route_tables = compile_route_tables(assigned_routes, centroids)
+    return SharedInputs.publish(centroids, amts_dens, centroid_distances, node_array, route_tables, endowments, geo_id_to_income)
+
+
+def simulate_partition(shared, engine, k, params):
+    """ Worker entry point: run (rho, alpha) params on partition k, from its SharedInputs handle """
+    inputs = shared.attach()
+    manager = SimulationManager(inputs.centroids, None, inputs.amts_dens, inputs.centroid_distances,
+                                engine=engine, node_array=inputs.node_array, partition=k)
+    if engine == 'ensemble':
+        manager.simulation_params = params
+        manager.run_parallel_simulations(inputs.route_tables, inputs.endowments, inputs.geo_id_to_income)
+        return
+    for rho, alpha in params:
+        manager.run_single_simulation(rho, alpha, inputs.route_tables, inputs.endowments, inputs.geo_id_to_income)
+
+
+def merge_partition_outputs(partitions, figkey, geo_id_to_income):
+    """ Merge the partitions' benchmark snapshots of figkey into one over all regions, written (and plotted) as usual """
+    paths = [snapshot_path(FIGURE_PKL_CACHE_DIR, partition_key(figkey, k)) for k in range(len(partitions))]
+    if not all(path.exists() for path in paths):
+        return
+    parts = []
+    for path in paths:
+        with np.load(path) as arrays:
+            parts.append({name: arrays[name] for name in arrays.files})
+        parts[-1]['avg_probabilities'] = load_probabilities(path)  # Memory-mapped, copied over partition by partition
+
+    order = np.argsort(np.concatenate(partitions))  # Partition-major rows -> global region order
+    merged = {name: parts[0][name] for name in ('rho', 'income_ids', 'income_values')}
+    for name in REGION_ARRAYS:
+        merged[name] = np.concatenate([part[name] for part in parts])[order]
+
+    # Agents (or cohorts), partition by partition; each only has probabilities over its own partition's regions
+    merged['agt_positions'] = np.concatenate([indices[part['agt_positions']] for indices, part in zip(partitions, parts)])
+    merged['agt_dows'] = np.concatenate([part['agt_dows'] for part in parts])
+    num_rows = sum(len(part['avg_probabilities']) for part in parts)
+    merged['avg_probabilities'] = probabilities_buffer(num_rows, len(order), FIGURE_PKL_CACHE_DIR)
+    start = 0
+    for indices, part in zip(partitions, parts):
+        stop = start + len(part['avg_probabilities'])
+        merged['avg_probabilities'][start:stop, indices] = part['avg_probabilities']
+        start = stop
+
+    write_benchmark(merged, geo_id_to_income, snapshot_path(FIGURE_PKL_CACHE_DIR, figkey), DATA_DIR / f"{figkey}_data.csv")
+    del parts, merged  # Close the memory maps before removing their files
+    for k, path in enumerate(paths):
+        path.unlink()
+        probabilities_path(path).unlink(missing_ok=True)
+        (DATA_DIR / f"{partition_key(figkey, k)}_data.csv").unlink(missing_ok=True)
+
+
+def run_partitioned_simulation(centroids, g, amts_dens, node_array, endowments, geo_id_to_income, partitions,
+                               engine=SIMULATION_ENGINE):
+    """
+    Simulate each region partition as its own city, with its own compact distance matrix, transport model and share
+    of the agents, in parallel workers; then merge their outputs into the usual per-benchmark CSV and snapshot files
+    """
+    if not RUN_EXPERIMENTS:
+        return
+    shares = split_endowments(endowments, partitions)
+    handles = [publish_partition(k, indices, centroids, g, amts_dens, node_array, share, geo_id_to_income)
+               for k, (indices, share) in enumerate(zip(partitions, shares))]
+
+    # One task per partition and (rho, alpha); the ensemble engine runs a partition's replicas in lock-step in one task
+    simulation_params = list(product(RHO_L, ALPHA_L))
+    if engine == 'ensemble':
+        tasks = [(k, simulation_params) for k in range(len(partitions))]
+    else:
+        tasks = [(k, [params]) for k in range(len(partitions)) for params in simulation_params]
+    Parallel(n_jobs=N_JOBS, backend='loky')(
+        delayed(simulate_partition)(handles[k], engine, k, params) for k, params in tasks
+    )
+
+    seeds = ENSEMBLE_SEEDS if engine == 'ensemble' else [None]
+    for rho, alpha, t_max, seed in product(RHO_L, ALPHA_L, T_MAX_L, seeds):
+        merge_partition_outputs(partitions, figure_key(rho, alpha, t_max, seed), geo_id_to_income)
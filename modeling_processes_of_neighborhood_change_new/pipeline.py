@@ -0,0 +1,77 @@
+# pipeline.py
+
+from config import N_JOBS
+from helper import FIGURE_PKL_CACHE_DIR, PLT_DIR, figure_key
+from snapshot import snapshot_path
+from visualization import plot_city
+from gif import gif_group, create_gif
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import defaultdict
+from contextlib import ExitStack
+from joblib import effective_n_jobs
+import time
+
+POLL_INTERVAL = 1.0  # Seconds between checks for new snapshots
+
+
+def _mtime(path):
+    return path.stat().st_mtime_ns if path.exists() else None
+
+
+def stream_outputs(simulate, centroids, frame_params, output_directory, duration, num_pause_frames, simulation_workers=1,
+                   poll_interval=POLL_INTERVAL):
+    """
+    Run simulate() while plotting: each benchmark snapshot (frame_params: (rho, alpha, t_max, seed)) is plotted
+    as soon as it is written, and each GIF is assembled as soon as its last frame is plotted.
+
+    A snapshot counts as written once it is new or rewritten since the start; once simulate() returns, every
+    remaining frame is plotted from whatever snapshot exists (e.g. benchmarks before a resumed checkpoint).
+
+    While simulate() runs its simulation_workers processes, plots only use the cores they leave free (at least one);
+    afterwards, every core.
+    """
+    snapshots = {params: snapshot_path(FIGURE_PKL_CACHE_DIR, figure_key(*params[:3], params[3])) for params in frame_params}
+    start_mtimes = {params: _mtime(path) for params, path in snapshots.items()}
+
+    # Frames of each GIF, keyed like gif.process_pdfs_to_gifs
+    pdfs = {params: PLT_DIR / f"{figure_key(*params[:3], params[3])}_matplotlib.pdf" for params in frame_params}
+    gif_frames = defaultdict(list)
+    for params, pdf in pdfs.items():
+        gif_frames[gif_group(pdf.name)[0]].append(params)
+
+    num_cores = effective_n_jobs(N_JOBS)
+    num_plot_workers = max(1, num_cores - simulation_workers)
+    with ThreadPoolExecutor(max_workers=1) as runner, ExitStack() as pools:
+        pool = pools.enter_context(ProcessPoolExecutor(max_workers=num_plot_workers))
+        full_pool = num_plot_workers == num_cores
+        simulation = runner.submit(simulate)
+        plots = {}  # Frame -> plot future
+        gifs = []
+        pending_gifs = dict(gif_frames)
+        while pending_gifs:
+            finished = simulation.done()
+            if finished and simulation.exception() is not None:
+                simulation.result()  # Raise simulation errors right away
+            if finished and not full_pool:
+                # The simulation's cores are free: further plots and GIFs use every core
+                pool = pools.enter_context(ProcessPoolExecutor(max_workers=num_cores))
+                full_pool = True
+            for params, path in snapshots.items():
+                if params not in plots and (finished or _mtime(path) != start_mtimes[params]):
+                    rho, alpha, t_max, seed = params
+                    plots[params] = pool.submit(plot_city, rho, alpha, t_max, centroids, seed)
+
+            for key, frames in list(pending_gifs.items()):
+                if all(params in plots and plots[params].done() for params in frames):
+                    for params in frames:
+                        plots[params].result()  # Raise plotting errors
+                    file_tuples = [(params[2], str(pdfs[params])) for params in frames if pdfs[params].exists()]
+                    gifs.append(pool.submit(create_gif, key, file_tuples, duration, num_pause_frames, output_directory))
+                    del pending_gifs[key]
+
+            if pending_gifs:
+                time.sleep(poll_interval)
+
+        simulation.result()  # Raise simulation errors
+        for gif in gifs:
+            gif.result()
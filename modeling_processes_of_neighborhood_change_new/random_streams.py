@@ -0,0 +1,37 @@
+# random_streams.py
+
+from config import ROOT_SEED
+import hashlib
+import numpy as np
+
+
+def stable_key(*parts):
+    """ Stable (across processes, machines and Python runs) 32-bit words for a run key like ('simulation', rho, alpha) """
+    digest = hashlib.sha256(repr(parts).encode()).digest()
+    return tuple(int.from_bytes(digest[k:k + 4], 'little') for k in range(0, 16, 4))
+
+
+def make_rng(*key, root_seed=ROOT_SEED):
+    """
+    Independent random Generator for a run, replica or pipeline stage.
+
+    Streams are derived from (root_seed, key) alone, so any run of a sweep can be recomputed
+    bit-identically in any process without coordinating seeds, and distinct keys never collide.
+    """
+    return np.random.default_rng(np.random.SeedSequence(root_seed, spawn_key=stable_key(*key)))
+
+
+def run_key(rho, alpha, seed=None, partition=None):
+    """ Stream key of one simulation run; seed tags an ensemble replicate, partition a region partition (see partitions.py) """
+    key = ('simulation', float(rho), float(alpha)) if seed is None else ('simulation', float(rho), float(alpha), int(seed))
+    return key if partition is None else key + ('partition', int(partition))
+
+
+def run_rng(rho, alpha, seed=None, partition=None):
+    """ Random stream of one simulation run """
+    return make_rng(*run_key(rho, alpha, seed, partition))
+
+
+def shard_rngs(rho, alpha, num_shards, partition=None):
+    """ Random streams of the agent shards of one run (see AgentShards.py) """
+    return [make_rng(*run_key(rho, alpha, partition=partition), 'shard', k) for k in range(num_shards)]
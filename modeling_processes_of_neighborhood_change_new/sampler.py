@@ -0,0 +1,237 @@
+# sampler.py
+
+import numpy as np
+
+
+class FenwickSampler:
+    """ Categorical sampler over nonnegative weights: O(log n) point updates and weighted draws """
+
+    def __init__(self, weights):
+        self.n = len(weights)
+        self.values = [float(w) for w in weights]  # Raw weights
+        self.total = float(sum(self.values))  # Normalizer
+
+        # Build Fenwick (binary indexed) tree in O(n); tree[i] sums values[i - lowbit(i), i)
+        self.tree = [0.0] + self.values
+        for i in range(1, self.n + 1):
+            parent = i + (i & -i)
+            if parent <= self.n:
+                self.tree[parent] += self.tree[i]
+
+        # Highest power of two <= n, start of the descent in sample()
+        self.top = 1 << (self.n.bit_length() - 1) if self.n else 0
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __setitem__(self, index, weight):
+        """ Point update of one weight """
+        delta = weight - self.values[index]
+        self.values[index] = weight
+        self.total += delta
+        i = index + 1
+        while i <= self.n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def gather(self, indices):
+        """ Raw weights at the given indices, as an array """
+        return np.array([self.values[i] for i in indices])
+
+    def sample(self, random=np.random.random):
+        """ Draw an index with probability weight / total """
+        target = random() * self.total
+        pos = 0
+        step = self.top
+        while step:
+            nxt = pos + step
+            if nxt <= self.n and self.tree[nxt] <= target:
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        return min(pos, self.n - 1)
+
+    def probabilities(self):
+        """ Normalized weights as an array (O(n); only when needed) """
+        return np.array(self.values) / self.total
+
+    def rescale(self, scale):
+        """ Divide every weight by scale (O(n)) """
+        self.values = [w / scale for w in self.values]
+        self.tree = [w / scale for w in self.tree]
+        self.total /= scale
+
+
+class SharedPrior:
+    """ Prior weights shared by many SparseDeltaSamplers, with their cumulative sums for O(log n) draws """
+
+    def __init__(self, weights):
+        self.values = np.asarray(weights, dtype=float)
+        self.cumulative = np.cumsum(self.values)
+        self.total = float(self.cumulative[-1])
+
+    def __len__(self):
+        return len(self.values)
+
+    def sample(self, random=np.random.random):
+        """ Draw an index with probability prior / prior total (O(log n)) """
+        index = int(np.searchsorted(self.cumulative, random() * self.total, side='right'))
+        return min(index, len(self.values) - 1)
+
+
+class SparseDeltaSampler:
+    """
+    Categorical sampler over weights scale * prior (a SharedPrior), except at the entries set since, which are kept
+    in a sparse map: memory grows with the number of entries set rather than with n.
+
+    A draw picks a set entry with probability (their weights) / total, in O(entries set); otherwise it draws from
+    the prior, rejecting set entries (O(n) once rejections pile up, i.e. when the set entries carry most of the prior).
+    """
+
+    MAX_REJECTIONS = 8
+
+    def __init__(self, prior):
+        self.prior = prior
+        self.n = len(prior)
+        self.scale = 1.0  # Weight per unit of prior of the entries never set
+        self.delta = {}  # Entry -> weight, for entries set (in order of first setting)
+        self.delta_total = 0.0  # Sum of the weights in delta
+        self.delta_prior = 0.0  # Sum of the prior at the entries in delta
+        self.total = prior.total  # Normalizer
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        weight = self.delta.get(index)
+        return self.scale * self.prior.values[index] if weight is None else weight
+
+    def __setitem__(self, index, weight):
+        """ Point update of one weight (O(1)) """
+        if index in self.delta:
+            self.delta_total += weight - self.delta[index]
+        else:
+            self.delta_total += weight
+            self.delta_prior += self.prior.values[index]
+        self.delta[index] = weight
+        self.total = self.delta_total + self.scale * self._unset_prior()
+
+    def _unset_prior(self):
+        """ Sum of the prior at the entries never set """
+        return max(self.prior.total - self.delta_prior, 0.0)
+
+    @property
+    def values(self):
+        """ All weights, as an array (O(n); only when needed) """
+        dense = self.scale * self.prior.values
+        if self.delta:
+            dense[list(self.delta)] = list(self.delta.values())
+        return dense
+
+    def gather(self, indices):
+        """ Raw weights at the given indices, as an array """
+        return np.array([self[i] for i in indices])
+
+    def sample(self, random=np.random.random):
+        """ Draw an index with probability weight / total """
+        target = random() * self.total
+        if target < self.delta_total or not self._unset_prior():
+            for index, weight in self.delta.items():
+                target -= weight
+                if target < 0:
+                    break
+            return index
+
+        # Entries never set, in proportion to the prior
+        for _ in range(self.MAX_REJECTIONS):
+            index = self.prior.sample(random)
+            if index not in self.delta:
+                return index
+        unset = self.prior.values.copy()
+        unset[list(self.delta)] = 0.0
+        cumulative = np.cumsum(unset)
+        return min(int(np.searchsorted(cumulative, random() * cumulative[-1], side='right')), self.n - 1)
+
+    def probabilities(self):
+        """ Normalized weights as an array (O(n); only when needed) """
+        return self.values / self.total
+
+    def rescale(self, scale):
+        """ Divide every weight by scale (O(entries set)) """
+        self.scale /= scale
+        self.delta = {index: weight / scale for index, weight in self.delta.items()}
+        self.delta_total /= scale
+        self.total /= scale
+
+
+class LazyProbabilitySum:
+    """
+    Running sum over timesteps of weights / total, settled lazily per entry.
+
+    Entries whose weight is unchanged contribute weight * sum_t(1 / total_t), so only
+    the running normalizer sum and a per-entry mark of it are kept; an entry is
+    settled just before its weight changes, and the whole vector only on demand.
+    """
+
+    def __init__(self, weights, total):
+        self.acc = np.zeros(len(weights))  # Settled part of the sum
+        self.mark = np.zeros(len(weights))  # inv_total_sum at each entry's last settle
+        self.inv_total_sum = 1.0 / total  # sum over timesteps of 1 / total
+        self.steps = 0  # timesteps counted into inv_total_sum (after the initial one)
+
+    def before_update(self, index, weight):
+        """ Settle one entry up to the current timestep, before its weight changes """
+        self.acc[index] += weight * (self.inv_total_sum - self.mark[index])
+        self.mark[index] = self.inv_total_sum
+
+    def step(self, total):
+        """ Add a timestep with the (updated) normalizer """
+        self.inv_total_sum += 1.0 / total
+        self.steps += 1
+
+    def catch_up(self, timestep, total):
+        """ Add the timesteps up to timestep in which the weights sat unchanged (partial update schedules) """
+        self.inv_total_sum += (timestep - self.steps) / total
+        self.steps = timestep
+
+    def rescale(self, scale):
+        """ Keep the sum unchanged while the weights (and so the totals) are divided by scale """
+        self.inv_total_sum *= scale
+        self.mark *= scale
+
+    def settle(self, weights):
+        """ Full sum of weights / total over all timesteps so far (O(n)) """
+        return self.acc + np.asarray(weights) * (self.inv_total_sum - self.mark)
+
+
+class SparseProbabilitySum(LazyProbabilitySum):
+    """ LazyProbabilitySum keeping acc and mark only for entries settled at least once (both are 0 for the others) """
+
+    def __init__(self, weights, total):
+        super().__init__((), total)
+        self.n = len(weights)
+        self.acc = {}
+        self.mark = {}
+
+    def before_update(self, index, weight):
+        """ Settle one entry up to the current timestep, before its weight changes """
+        self.acc[index] = self.acc.get(index, 0.0) + weight * (self.inv_total_sum - self.mark.get(index, 0.0))
+        self.mark[index] = self.inv_total_sum
+
+    def rescale(self, scale):
+        """ Keep the sum unchanged while the weights (and so the totals) are divided by scale """
+        self.inv_total_sum *= scale
+        self.mark = {index: mark * scale for index, mark in self.mark.items()}
+
+    def settle(self, weights):
+        """ Full sum of weights / total over all timesteps so far (O(n)) """
+        acc = np.zeros(self.n)
+        mark = np.zeros(self.n)
+        if self.acc:
+            indices = list(self.acc)
+            acc[indices] = list(self.acc.values())
+            mark[indices] = [self.mark[index] for index in indices]
+        return acc + np.asarray(weights) * (self.inv_total_sum - mark)
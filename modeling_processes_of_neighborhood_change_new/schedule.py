@@ -0,0 +1,41 @@
+# schedule.py
+
+from config import UPDATE_SCHEDULE, UPDATE_FRACTION, UPDATE_RATE
+import numpy as np
+
+SCHEDULES = ('all', 'fraction', 'poisson', 'single')
+
+
+def active_agents(num_agents, rng, schedule=UPDATE_SCHEDULE):
+    """
+    Indices (ascending) of the agents that move this timestep, or None if all of them do.
+
+    'fraction': a random UPDATE_FRACTION of the agents
+    'poisson':  every agent whose Poisson clock (rate UPDATE_RATE per timestep) rings at least once
+    'single':   one random agent (one relocation per timestep)
+    """
+    if schedule == 'all':
+        return None
+    if schedule == 'fraction':
+        num_active = max(1, int(round(UPDATE_FRACTION * num_agents)))
+        return np.sort(rng.choice(num_agents, size=num_active, replace=False))
+    if schedule == 'poisson':
+        return np.flatnonzero(rng.random(num_agents) < -np.expm1(-UPDATE_RATE))
+    if schedule == 'single':
+        return np.array([rng.integers(num_agents)])
+    raise ValueError(f"Unknown update schedule '{schedule}'")
+
+
+def active_counts(counts, rng, schedule=UPDATE_SCHEDULE):
+    """ Cohort version of active_agents: how many of each count (e.g. per cohort and region) move this timestep """
+    if schedule == 'all':
+        return counts
+    if schedule == 'poisson':
+        return rng.binomial(counts, -np.expm1(-UPDATE_RATE))
+    if schedule == 'fraction':
+        num_active = max(1, int(round(UPDATE_FRACTION * counts.sum())))
+    elif schedule == 'single':
+        num_active = 1
+    else:
+        raise ValueError(f"Unknown update schedule '{schedule}'")
+    return rng.multivariate_hypergeometric(counts.ravel(), num_active).reshape(counts.shape)
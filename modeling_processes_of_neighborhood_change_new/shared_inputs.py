@@ -0,0 +1,79 @@
+# shared_inputs.py
+
+from helper import SHARED_INPUTS_CACHE_DIR
+from hasher import hash_function
+from four_step_model import RouteTables
+from typing import NamedTuple, Any
+import os
+import numpy as np
+
+
+class SimulationInputs(NamedTuple):
+    """ Read-only inputs of a simulation run (arrays are memory-mapped when attached from SharedInputs) """
+    centroids: list
+    amts_dens: Any
+    centroid_distances: Any
+    node_array: Any
+    route_tables: Any
+    endowments: Any
+    geo_id_to_income: dict
+
+
+class SharedInputs:
+    """
+    Large read-only simulation inputs, published once per sweep as .npy files.
+
+    Workers attach() to them as read-only memory maps: a task only pickles this handle (file paths plus
+    the small centroid and income tables), and every worker shares the same pages of the OS file cache.
+    The OSM graph is never shipped; Cities use the centroid nodes snapped once in the parent.
+    """
+
+    def __init__(self, directory, centroids, geo_id_to_income, has_routes):
+        self.directory = directory
+        self.centroids = centroids
+        self.geo_id_to_income = geo_id_to_income
+        self.has_routes = has_routes
+
+    @classmethod
+    def publish(cls, centroids, amts_dens, centroid_distances, node_array, route_tables, endowments, geo_id_to_income,
+                cache_dir=SHARED_INPUTS_CACHE_DIR):
+        """ Write the arrays (once per distinct content) and return a cheap-to-pickle handle """
+        arrays = {
+            'amts_dens': np.asarray(amts_dens, dtype=float),
+            'centroid_distances': np.asarray(centroid_distances),
+            'node_array': np.asarray(node_array),
+            'endowments': np.asarray(endowments, dtype=float),
+        }
+        if route_tables is not None:
+            arrays['route_offsets'] = np.asarray(route_tables.offsets)
+            arrays['route_dest_indices'] = np.asarray(route_tables.dest_indices)
+            arrays['route_volumes'] = np.asarray(route_tables.volumes)
+
+        directory = cache_dir / hash_function(*(arrays[name] for name in sorted(arrays)))
+        directory.mkdir(parents=True, exist_ok=True)
+        for name, array in arrays.items():
+            path = directory / f"{name}.npy"
+            if not path.exists():
+                tmp_path = directory / f"{name}.tmp.npy"
+                np.save(tmp_path, array)
+                os.replace(tmp_path, path)  # Concurrent sweeps never see a half-written file
+        return cls(directory, centroids, geo_id_to_income, route_tables is not None)
+
+    def _load(self, name):
+        return np.load(self.directory / f"{name}.npy", mmap_mode='r')
+
+    def attach(self):
+        """ Zero-copy view of the inputs (in a worker) """
+        route_tables = None
+        if self.has_routes:
+            route_tables = RouteTables(len(self.centroids), self._load('route_offsets'),
+                                       self._load('route_dest_indices'), self._load('route_volumes'))
+        return SimulationInputs(
+            centroids=self.centroids,
+            amts_dens=self._load('amts_dens'),
+            centroid_distances=self._load('centroid_distances'),
+            node_array=self._load('node_array'),
+            route_tables=route_tables,
+            endowments=self._load('endowments'),
+            geo_id_to_income=self.geo_id_to_income,
+        )
@@ -1,124 +1,401 @@
 # simulation.py
 
-from config import RHO_L, ALPHA_L, NUM_AGENTS, RUN_EXPERIMENTS, CTY_KEY, N_JOBS, T_MAX_RANGE
-from helper import DATA_DIR, FIGURE_PKL_CACHE_DIR, T_MAX_L
-from Agent import Agent
+from config import RHO_L, ALPHA_L, NUM_AGENTS, RUN_EXPERIMENTS, N_JOBS, T_MAX_RANGE, SIMULATION_ENGINE, ENSEMBLE_SEEDS, CHECKPOINT_INTERVAL, SPARSE_WEIGHTS, CANDIDATE_K, CANDIDATE_EXPLORE, UPDATE_SCHEDULE, WEIGHT_DTYPE, INTRA_RUN_SHARDS, IMMIGRATION_RATE, EMIGRATION_RATE, POOL_CAPACITY, AGENT_BLOCK_SIZE, HISTORY_SPILL_CHUNK, CONVERGENCE_WINDOW, CONVERGENCE_TOL, CTY_KEY
+from helper import DATA_DIR, FIGURE_PKL_CACHE_DIR, HISTORY_CACHE_DIR, AGENT_STATE_CACHE_DIR, T_MAX_L, figure_key, partition_key
+from checkpoint import checkpoint_path, save_checkpoint, load_checkpoint
+from snapshot import snapshot_path, probabilities_buffer, write_benchmark, SnapshotWriter
+from convergence import ConvergenceMonitor, all_converged
+from Agent import Agent, agents_checkpoint_state, restore_agents_checkpoint_state
+from AgentArrays import AgentArrays
+from AgentEnsemble import AgentEnsemble
+from AgentCohorts import AgentCohorts
+from AgentCandidates import AgentCandidates
+from AgentPool import AgentPool
+from AgentShards import AgentShards
+from AgentBlocks import AgentBlocks
+from candidates import CandidateSets
+from sampler import SharedPrior
+from schedule import SCHEDULES, active_agents
+from random_streams import run_rng, shard_rngs
 from City import City
+from graph_handler import cached_centroid_nodes
+from shared_inputs import SharedInputs
 from itertools import product
 from joblib import Parallel, delayed
 import numpy as np
-import pickle
 import time
 
 class SimulationManager:
     """Manages the execution of multiple simulation runs"""
 
-    def __init__(self, centroids, g, amts_dens, centroid_distances):
+    def __init__(self, centroids, g, amts_dens, centroid_distances, engine=SIMULATION_ENGINE, node_array=None, partition=None):
+        if engine not in ('agent', 'vectorized', 'ensemble', 'cohort'):
+            raise ValueError(f"Unknown simulation engine '{engine}'")
+        if CANDIDATE_K and engine not in ('agent', 'vectorized'):
+            raise ValueError(f"CANDIDATE_K is not supported by the '{engine}' engine")
+        if WEIGHT_DTYPE not in ('float64', 'float32'):
+            raise ValueError(f"Unknown weight dtype '{WEIGHT_DTYPE}'")
+        if SPARSE_WEIGHTS and (engine != 'agent' or CANDIDATE_K):
+            raise ValueError("SPARSE_WEIGHTS needs the 'agent' engine without CANDIDATE_K")
+        if AGENT_BLOCK_SIZE and (engine != 'vectorized' or CANDIDATE_K or INTRA_RUN_SHARDS > 1 or IMMIGRATION_RATE or EMIGRATION_RATE):
+            raise ValueError("AGENT_BLOCK_SIZE needs the 'vectorized' engine without CANDIDATE_K, INTRA_RUN_SHARDS or migration")
+        if UPDATE_SCHEDULE not in SCHEDULES:
+            raise ValueError(f"Unknown update schedule '{UPDATE_SCHEDULE}'")
+        if UPDATE_SCHEDULE != 'all' and engine == 'ensemble':
+            raise ValueError(f"UPDATE_SCHEDULE '{UPDATE_SCHEDULE}' is not supported by the 'ensemble' engine")
+        if (IMMIGRATION_RATE or EMIGRATION_RATE) and (engine != 'vectorized' or CANDIDATE_K):
+            raise ValueError("Migration (IMMIGRATION_RATE / EMIGRATION_RATE) needs the 'vectorized' engine without CANDIDATE_K")
+        if INTRA_RUN_SHARDS > 1 and (engine != 'vectorized' or CANDIDATE_K or UPDATE_SCHEDULE != 'all' or IMMIGRATION_RATE or EMIGRATION_RATE):
+            raise ValueError("INTRA_RUN_SHARDS needs the 'vectorized' engine, UPDATE_SCHEDULE 'all', no CANDIDATE_K and no migration")
         self.centroids = centroids
         self.g = g
         self.amts_dens = amts_dens
         self.centroid_distances = centroid_distances
+        self.engine = engine
+        self.writer = None  # Background writer of benchmark outputs (see snapshot_writer)
+        self.node_array = node_array  # Nearest graph node of each centroid; snapped on first use if not given
+        self.partition = partition  # Region partition simulated (see partitions.py); tags output file names
+        self.candidate_sets = CandidateSets(centroid_distances, CANDIDATE_K, CANDIDATE_EXPLORE) if CANDIDATE_K else None
+        self.weight_prior = SharedPrior(amts_dens / np.sum(amts_dens)) if SPARSE_WEIGHTS else None  # Shared by all agents
         self.simulation_params = list(product(RHO_L, ALPHA_L))
         self.benchmarks = sorted(T_MAX_L)
 
-    def initialize_agents(self, city, alpha, endowments):
+    def initialize_agents(self, city, alpha, endowments, rng):
         """Step 1: Initialize agents with sampling distribution"""
         # Generate agent endowments using economic_distribution.py
         agt_dows = endowments
 
         # Create agents with initial sampling distributions
-        agents = [Agent(i, dow, city, alpha=alpha) for i, dow in enumerate(agt_dows)]
+        agents = [Agent(i, dow, city, alpha=alpha, rng=rng, candidate_sets=self.candidate_sets, prior=self.weight_prior) for i, dow in enumerate(agt_dows)]
         return agents
 
-    def run_parallel_simulations(self, assigned_routes, endowments, geo_id_to_income):
+    def initialize_agent_arrays(self, city, alpha, endowments, route_tables, rng, state_dir=None):
+        """Step 1: Initialize all agents as one struct-of-arrays (or income-cohort) engine"""
+        if self.engine == 'cohort':
+            return AgentCohorts(endowments, city, alpha=alpha, route_tables=route_tables, rng=rng)
+        if self.candidate_sets is not None:
+            return AgentCandidates(endowments, city, self.candidate_sets, alpha=alpha, route_tables=route_tables, rng=rng)
+        if INTRA_RUN_SHARDS > 1:
+            return AgentShards(endowments, city, shard_rngs(city.rho, alpha, INTRA_RUN_SHARDS, self.partition), alpha=alpha, route_tables=route_tables)
+        if IMMIGRATION_RATE or EMIGRATION_RATE:
+            return AgentPool(endowments, city, POOL_CAPACITY * len(endowments), alpha=alpha, route_tables=route_tables, rng=rng)
+        if AGENT_BLOCK_SIZE:
+            return AgentBlocks(endowments, city, state_dir, AGENT_BLOCK_SIZE, alpha=alpha, route_tables=route_tables, rng=rng)
+        return AgentArrays(endowments, city, alpha=alpha, route_tables=route_tables, rng=rng)
+
+    def run_parallel_simulations(self, route_tables, endowments, geo_id_to_income):
         """Execute multiple simulations in parallel"""
         if not RUN_EXPERIMENTS:
             return
 
+        # Ensemble: every (rho, alpha, seed) replica in lock-step in this process
+        if self.engine == 'ensemble':
+            replica_params = [(rho, alpha, seed) for rho, alpha in self.simulation_params for seed in ENSEMBLE_SEEDS]
+            self.run_ensemble_simulation(replica_params, route_tables, endowments, geo_id_to_income)
+            return
+
+        # Publish large read-only inputs once; workers attach to them as memory maps instead of unpickling copies
+        shared = self.publish_inputs(route_tables, endowments, geo_id_to_income)
+
         # Run parallel processing using all available CPUs
         Parallel(n_jobs=N_JOBS, backend='loky')(
-            delayed(self.run_single_simulation)(
-                rho, alpha, assigned_routes, endowments, geo_id_to_income
-            )
+            delayed(run_shared_simulation)(shared, self.engine, rho, alpha)
             for rho, alpha in self.simulation_params
         )
 
-    def run_single_simulation(self, rho, alpha, assigned_routes, endowments, geo_id_to_income):
+    def centroid_node_array(self):
+        """Nearest graph node of each centroid, snapped once per manager"""
+        if self.node_array is None:
+            self.node_array = cached_centroid_nodes(self.g, self.centroids)
+        return self.node_array
+
+    def publish_inputs(self, route_tables, endowments, geo_id_to_income):
+        """Write the large read-only inputs once for a sweep's workers (see shared_inputs.py)"""
+        return SharedInputs.publish(self.centroids, self.amts_dens, self.centroid_distances, self.centroid_node_array(),
+                                    route_tables, endowments, geo_id_to_income)
+
+    def run_single_simulation(self, rho, alpha, route_tables, endowments, geo_id_to_income):
         """Execute a single simulation with given parameters"""
+        if self.engine == 'ensemble':
+            self.run_ensemble_simulation([(rho, alpha, None)], route_tables, endowments, geo_id_to_income)
+            return
+
         start_time = time.time()
         
-        # Set random seed based on parameters for reproducibility
-        seed = int(rho * 1000 + alpha * 100)
-        np.random.seed(seed)
+        # Independent random stream of this run, derived from ROOT_SEED and (rho, alpha) (and its partition, if any)
+        rng = run_rng(rho, alpha, partition=self.partition)
+
+        # Checkpoint of this configuration (its name also keys the history spill and agent state directories)
+        ckpt_path = self.checkpoint_path(f"{CTY_KEY}_{rho}_{alpha}", (rho, alpha), route_tables, endowments)
 
         # Step 1: Initialize city and agents
-        city = City(self.centroids, self.g, self.amts_dens, self.centroid_distances, rho=rho, geo_id_to_income=geo_id_to_income)
-        agents = self.initialize_agents(city, alpha, endowments)
-        city.set_agts(agents)
-        city.update()
+        city = City(self.centroids, self.g, self.amts_dens, self.centroid_distances, rho=rho, geo_id_to_income=geo_id_to_income,
+                    history_dir=self.history_dir(ckpt_path), node_array=self.centroid_node_array())
+        if self.engine != 'agent':
+            agents = self.initialize_agent_arrays(city, alpha, endowments, route_tables, rng, AGENT_STATE_CACHE_DIR / ckpt_path.stem)
+            city.set_agt_arrays(agents)
+        else:
+            agents = self.initialize_agents(city, alpha, endowments, rng)
+            city.set_agts(agents)
+        try:
+            if self.engine != 'agent':
+                agents.update_city()
+            else:
+                city.update()
 
-        # Track current benchmark for saving data
-        benchmark_index = 0
+            # Resume from (or extend) the last checkpoint of this configuration
+            monitors = self.convergence_monitors(1)
+            start_t = self.resume_from_checkpoint(ckpt_path, [city], agents, monitors)
 
-        # Main simulation loop
-        for t in range(T_MAX_RANGE):
-            self.execute_simulation_step(city, assigned_routes)
+            # Track current benchmark for saving data
+            benchmark_index = int(np.searchsorted(self.benchmarks, start_t, side='right'))
 
-            if (t + 1) == self.benchmarks[benchmark_index]:
-                self.save_simulation_state(city, rho, alpha, t + 1)
-                benchmark_index += 1
-        
-        # Log completion
+            # Main simulation loop
+            timestep = start_t
+            for t in range(start_t, T_MAX_RANGE):
+                if all_converged(monitors):
+                    break
+
+                if self.engine != 'agent':
+                    agents.step()
+                else:
+                    self.execute_simulation_step(city, route_tables, active_agents(len(agents), rng), t + 1)
+                timestep = t + 1
+
+                if timestep == self.benchmarks[benchmark_index]:
+                    self.save_simulation_state(city, rho, alpha, timestep)
+                    benchmark_index += 1
+
+                for monitor in monitors:
+                    monitor.observe(city.pop_array, city.cmt_array, lambda: self.mean_distribution(agents))
+
+                self.save_checkpoint_if_due(ckpt_path, timestep, [city], agents, monitors)
+
+            # Steady state: remaining benchmarks are copies of the converged state
+            if all_converged(monitors):
+                for benchmark in self.benchmarks[benchmark_index:]:
+                    self.save_simulation_state(city, rho, alpha, benchmark, steps=timestep)
+                print(f"Simulation {rho}_{alpha}_{NUM_AGENTS} converged at timestep {timestep}")
+                benchmark_index = len(self.benchmarks)
+
+        finally:
+            if isinstance(agents, AgentShards):
+                agents.close()  # Stop its worker threads, also if the run failed
+            self.close_snapshot_writer()  # Write (or report the errors of) every queued benchmark output
+
+        # Log completion (once every output is written)
         simulation_name = f"{rho}_{alpha}_{NUM_AGENTS}_{self.benchmarks[benchmark_index-1]}"
         end_time = time.time()
         print(f"Simulation {simulation_name} done [{end_time - start_time:.2f} s]")
 
-    def execute_simulation_step(self, city, assigned_routes):
-        """Execute one step of the simulation"""
+    def run_ensemble_simulation(self, replica_params, route_tables, endowments, geo_id_to_income):
+        """Execute R simulations, one per (rho, alpha, seed), in lock-step in one process"""
+        start_time = time.time()
+
+        # Checkpoint of this configuration (its name also keys the history spill directories)
+        ckpt_path = self.checkpoint_path(f"{CTY_KEY}_ensemble", replica_params, route_tables, endowments)
+
+        # Step 1: Initialize one city per replica and all agents at once
+        cities = [
+            City(self.centroids, self.g, self.amts_dens, self.centroid_distances, rho=rho, geo_id_to_income=geo_id_to_income,
+                 history_dir=self.history_dir(ckpt_path, r), node_array=self.centroid_node_array())
+            for r, (rho, _, _) in enumerate(replica_params)
+        ]
+        alphas = [alpha for _, alpha, _ in replica_params]
+        rngs = [run_rng(rho, alpha, seed, self.partition) for rho, alpha, seed in replica_params]
+        agents = AgentEnsemble(endowments, cities, alphas, rngs, route_tables=route_tables)
+        try:
+            agents.update_city()
+
+            # Resume from (or extend) the last checkpoint of this configuration
+            monitors = self.convergence_monitors(len(cities))
+            start_t = self.resume_from_checkpoint(ckpt_path, cities, agents, monitors)
+
+            # Track current benchmark for saving data
+            benchmark_index = int(np.searchsorted(self.benchmarks, start_t, side='right'))
+
+            # Main simulation loop (replicas run in lock-step, so stop once all of them have converged)
+            timestep = start_t
+            for t in range(start_t, T_MAX_RANGE):
+                if all_converged(monitors):
+                    break
+
+                agents.step()
+                timestep = t + 1
+
+                if timestep == self.benchmarks[benchmark_index]:
+                    for r, (rho, alpha, seed) in enumerate(replica_params):
+                        cities[r].set_agt_arrays(agents.replica_agents(r))
+                        self.save_simulation_state(cities[r], rho, alpha, timestep, seed=seed)
+                    benchmark_index += 1
+
+                for r, monitor in enumerate(monitors):
+                    monitor.observe(cities[r].pop_array, cities[r].cmt_array, lambda: agents.mean_probabilities(agents._rows(r)))
+
+                self.save_checkpoint_if_due(ckpt_path, timestep, cities, agents, monitors)
+
+            # Steady state: remaining benchmarks are copies of the converged state
+            if all_converged(monitors):
+                for r, (rho, alpha, seed) in enumerate(replica_params):
+                    cities[r].set_agt_arrays(agents.replica_agents(r))
+                    for benchmark in self.benchmarks[benchmark_index:]:
+                        self.save_simulation_state(cities[r], rho, alpha, benchmark, seed=seed, steps=timestep)
+                print(f"Ensemble converged at timestep {timestep}")
+                benchmark_index = len(self.benchmarks)
+
+        finally:
+            self.close_snapshot_writer()  # Write (or report the errors of) every queued benchmark output
+
+        # Log completion (once every output is written)
+        end_time = time.time()
+        print(f"Ensemble of {len(replica_params)} simulations ({NUM_AGENTS} agents, {self.benchmarks[benchmark_index-1]} steps) done [{end_time - start_time:.2f} s]")
+
+    def checkpoint_path(self, name, params, route_tables, endowments):
+        """Checkpoint file for this engine, parameters and inputs (independent of T_MAX_RANGE)"""
+        route_arrays = None if route_tables is None else tuple(
+            np.asarray(array) for array in (route_tables.offsets, route_tables.dest_indices, route_tables.volumes))
+        centroid_ids = [c[4] for c in self.centroids]
+        return checkpoint_path(name, self.engine, params, centroid_ids, np.asarray(self.amts_dens), np.asarray(endowments), route_arrays)
+
+    def history_dir(self, ckpt_path, replica=None):
+        """Spill directory of a run's history (see history.py), or None to keep it in memory"""
+        if not HISTORY_SPILL_CHUNK:
+            return None
+        directory = HISTORY_CACHE_DIR / ckpt_path.stem
+        return directory if replica is None else directory / f"replica_{replica}"
+
+    def convergence_monitors(self, num_cities):
+        """One steady-state monitor per city, or none if early termination is off"""
+        if not CONVERGENCE_WINDOW:
+            return []
+        return [ConvergenceMonitor(len(self.centroids), CONVERGENCE_WINDOW, CONVERGENCE_TOL) for _ in range(num_cities)]
+
+    def mean_distribution(self, agents):
+        """Sampling distribution averaged over all agents"""
+        if self.engine == 'agent':
+            return np.mean([agent.probabilities for agent in agents], axis=0)
+        return agents.mean_probabilities()
+
+    def resume_from_checkpoint(self, path, cities, agents, monitors=()):
+        """Restore the last checkpoint, if any; return the timestep to continue from"""
+        if not CHECKPOINT_INTERVAL:
+            return 0
+        timestep, state = load_checkpoint(path)
+        if state is None or timestep >= T_MAX_RANGE:
+            return 0  # Nothing left to run: a rerun with the same horizon starts over and rewrites its outputs
+        if self.engine == 'agent':
+            restore_agents_checkpoint_state(agents, state['agents'])
+        else:
+            agents.restore_checkpoint_state(state['agents'])
+        for city, city_state in zip(cities, state['cities']):
+            city.restore_checkpoint_state(city_state)
+        for monitor, monitor_state in zip(monitors, state.get('monitors', ())):
+            monitor.restore_checkpoint_state(monitor_state)
+        print(f"Resuming {path.name} from timestep {timestep}")
+        return timestep
+
+    def save_checkpoint_if_due(self, path, timestep, cities, agents, monitors=()):
+        """Checkpoint every CHECKPOINT_INTERVAL steps, and at the end (or on convergence) so a finished run can be extended"""
+        finished = timestep == T_MAX_RANGE or all_converged(monitors)
+        if not CHECKPOINT_INTERVAL or (timestep % CHECKPOINT_INTERVAL and not finished):
+            return
+        if self.engine == 'agent':
+            agent_state = agents_checkpoint_state(agents)
+        else:
+            agent_state = agents.checkpoint_state()
+        state = {
+            'agents': agent_state,
+            'cities': [city.checkpoint_state() for city in cities],
+            'monitors': [monitor.checkpoint_state() for monitor in monitors],
+        }
+        self.snapshot_writer().flush()  # A resumed run never revisits benchmarks before its checkpoint
+        save_checkpoint(path, timestep, state)
+
+    def execute_simulation_step(self, city, route_tables, active=None, timestep=None):
+        """Execute one step of the simulation (timestep), for all agents or only the active ones"""
+        movers = city.agts if active is None else [city.agts[k] for k in active]
+
         # Step 2: Modify routes and positions
-        for agent in city.agts:
-            agent.assign_routes(assigned_routes)
+        for agent in movers:
+            agent.assign_routes(route_tables)
 
-        # Step 3: Update positions and calculate costs
-        for agent in city.agts:
+        # Step 3: Update positions and calculate costs (the city only revisits regions with arrivals or departures)
+        for agent in movers:
             agent.act()
         city.update()
-        for agent in city.agts:
-            agent.learn()
+        for agent in movers:
+            agent.learn(timestep)
+
+    def save_simulation_state(self, city, rho, alpha, timestep, seed=None, steps=None):
+        """Save simulation results to files (labelled timestep; averaged over steps, if stopped early)"""
+        steps = timestep if steps is None else steps
+        if isinstance(city.agts, AgentPool):
+            # Only the agents living in the city (compact copy, as for ensemble replicas)
+            pool = city.agts
+            city.set_agt_arrays(pool.live_agents())
+            self.save_simulation_state(city, rho, alpha, timestep, seed, steps)
+            city.set_agt_arrays(pool)
+            return
 
-    def save_simulation_state(self, city, rho, alpha, timestep):
-        """Save simulation results to files"""
-        # Update average probabilities for each agent
-        for agent in city.agts:
-            agent.avg_probabilities = agent.tot_probabilities / timestep
+        # Agent positions and average probabilities
+        if self.engine == 'agent':
+            positions = np.array([agent.u for agent in city.agts])
+            avg_probabilities = probabilities_buffer(len(city.agts), city.n)  # Streamed row by row, never stacked in memory
+            for i, agent in enumerate(city.agts):
+                agent.catch_up(steps)
+                avg_probabilities[i] = agent.tot_probabilities / steps
+        else:
+            positions = city.agts.u
+            if isinstance(city.agts, AgentBlocks):
+                avg_probabilities = city.agts.average_probabilities(steps)  # Out of core, like the agent state
+            else:
+                avg_probabilities = city.agts.tot_probabilities / steps
 
-        # Save city state
-        self._save_pickle(city, rho, alpha, timestep)
+        # Save city state and centroid data in the background, from copies of the state arrays
+        figkey = figure_key(rho, alpha, timestep, seed)
+        if self.partition is not None:
+            figkey = partition_key(figkey, self.partition)
+        arrays = city.snapshot_arrays(positions, avg_probabilities)
+        self.snapshot_writer().submit(write_benchmark, arrays, city.geo_id_to_income,
+                                      snapshot_path(FIGURE_PKL_CACHE_DIR, figkey), DATA_DIR / f"{figkey}_data.csv")
 
-        # Save centroid data
-        self._save_csv(city, rho, alpha, timestep)
+    def snapshot_writer(self):
+        """Background writer of benchmark outputs, started on first use"""
+        if self.writer is None:
+            self.writer = SnapshotWriter()
+        return self.writer
 
-    def _save_pickle(self, city, rho, alpha, timestep):
-        """Save city state to pickle file"""
-        pickle_filename = f"{CTY_KEY}_{rho}_{alpha}_{NUM_AGENTS}_{timestep}.pkl"
-        with open(FIGURE_PKL_CACHE_DIR / pickle_filename, 'wb') as file:
-            pickle.dump(city, file, protocol=pickle.HIGHEST_PROTOCOL)
+    def close_snapshot_writer(self):
+        """Wait for every pending benchmark output"""
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            writer.close()
 
-    def _save_csv(self, city, rho, alpha, timestep):
-        """Save centroid data to CSV"""
-        df_data = city.get_data()
-        csv_filename = f"{CTY_KEY}_{rho}_{alpha}_{NUM_AGENTS}_{timestep}_data.csv"
-        csv_path = DATA_DIR / csv_filename
-        df_data.to_csv(csv_path, index=False)
 
+def run_shared_simulation(shared, engine, rho, alpha):
+    """Worker entry point: run one simulation on inputs attached from a SharedInputs handle"""
+    inputs = shared.attach()
+    manager = SimulationManager(inputs.centroids, None, inputs.amts_dens, inputs.centroid_distances,
+                                engine=engine, node_array=inputs.node_array)
+    manager.run_single_simulation(rho, alpha, inputs.route_tables, inputs.endowments, inputs.geo_id_to_income)
 
-def run_simulation(centroids, g, amts_dens, centroid_distances, assigned_routes, endowments, geo_id_to_income):
+
+def run_simulation(centroids, g, amts_dens, centroid_distances, route_tables, endowments, geo_id_to_income,
+                   engine=SIMULATION_ENGINE, node_array=None):
     """Main entry point for running simulations"""
-    manager = SimulationManager(centroids, g, amts_dens, centroid_distances)
-    manager.run_parallel_simulations(assigned_routes, endowments, geo_id_to_income)
+    manager = SimulationManager(centroids, g, amts_dens, centroid_distances, engine=engine, node_array=node_array)
+    manager.run_parallel_simulations(route_tables, endowments, geo_id_to_income)
     
 def run_single_simulation_calibration(rho, alpha, centroids, g, amts_dens, centroid_distances, 
-                                      assigned_routes, endowments, geo_id_to_income
+                                      route_tables, endowments, geo_id_to_income,
+                                      engine=SIMULATION_ENGINE, node_array=None
                                       ):
-    manager = SimulationManager(centroids, g, amts_dens, centroid_distances)
-    manager.run_single_simulation(rho, alpha, assigned_routes, endowments, geo_id_to_income)
\ No newline at end of file
+    manager = SimulationManager(centroids, g, amts_dens, centroid_distances, engine=engine, node_array=node_array)
+    manager.run_single_simulation(rho, alpha, route_tables, endowments, geo_id_to_income)
+
+def run_ensemble_simulation_calibration(params, centroids, g, amts_dens, centroid_distances,
+                                        route_tables, endowments, geo_id_to_income, node_array=None
+                                        ):
+    """Run every (rho, alpha) in params as one lock-step ensemble (e.g. a whole GA generation)"""
+    manager = SimulationManager(centroids, g, amts_dens, centroid_distances, engine='ensemble', node_array=node_array)
+    manager.run_ensemble_simulation([(rho, alpha, None) for rho, alpha in params], route_tables, endowments, geo_id_to_income)
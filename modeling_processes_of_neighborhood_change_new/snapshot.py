@@ -0,0 +1,120 @@
+# snapshot.py
+
+from config import SNAPSHOT_QUEUE_SIZE
+from City import City
+from pathlib import Path
+import os
+import queue
+import tempfile
+import threading
+import numpy as np
+
+
+def snapshot_path(directory, figkey):
+    """ Benchmark snapshot file for a figure key """
+    return directory / f"{figkey}.npz"
+
+
+def probabilities_path(path):
+    """ Average probabilities of a benchmark snapshot: a plain (memory-mappable) .npy file next to it """
+    return Path(path).with_suffix('.probabilities.npy')
+
+
+def probabilities_buffer(num_rows, n, directory=None):
+    """ float32 (rows x regions) array for a snapshot's average probabilities, backed by an unlinked temporary file """
+    with tempfile.TemporaryFile(dir=directory) as file:
+        return np.memmap(file, dtype=np.float32, mode='w+', shape=(num_rows, n))
+
+
+def write_benchmark(arrays, geo_id_to_income, path, csv_path):
+    """
+    Write a benchmark snapshot (compressed state arrays only; no graph, no City/Agent objects)
+    and its centroid data CSV, from City.snapshot_arrays(). The agents x regions average probabilities
+    go to their own uncompressed .npy file (see probabilities_path), streamed from the array (or memmap) as is
+    """
+    arrays = dict(arrays)
+    probabilities = arrays.pop('avg_probabilities')
+    tmp_path = path.with_suffix('.tmp.npy')
+    with open(tmp_path, 'wb') as file:
+        np.save(file, probabilities)
+    os.replace(tmp_path, probabilities_path(path))
+
+    tmp_path = path.with_suffix('.tmp.npz')
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)  # Readers (see pipeline.py) never see a half-written snapshot; its probabilities come first
+    city = City.from_snapshot(arrays)
+    city.geo_id_to_income = geo_id_to_income  # Original values, so the CSV matches one written from the live City
+    city.get_data().to_csv(csv_path, index=False)
+
+
+def load_snapshot(path, probabilities=False):
+    """
+    Load a benchmark snapshot as a graph-less City supporting get_data() and plotting;
+    its avg_probabilities are only attached (memory-mapped) if probabilities is set
+    """
+    with np.load(path) as arrays:
+        city = City.from_snapshot({name: arrays[name] for name in arrays.files})
+    if probabilities:
+        city.avg_probabilities = load_probabilities(path)
+    return city
+
+
+def load_probabilities(path):
+    """ Average probabilities of a benchmark snapshot, memory-mapped read-only """
+    return np.load(probabilities_path(path), mmap_mode='r')
+
+
+class SnapshotWriter:
+    """
+    Background writer of benchmark outputs: the simulation hands over copied state arrays and carries on,
+    and only blocks (backpressure) once max_pending outputs are waiting. max_pending = 0 writes synchronously.
+    """
+
+    def __init__(self, max_pending=SNAPSHOT_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=max_pending) if max_pending > 0 else None
+        self.error = None  # First failure of the writer thread, raised in the simulation thread
+        self.thread = None
+        if self.queue is not None:
+            self.thread = threading.Thread(target=self._run, name='snapshot-writer', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                if self.error is None:
+                    fn, args = job
+                    fn(*args)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def _raise(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, fn, *args):
+        """ Run fn(*args) on the writer (waits while the queue is full) """
+        self._raise()
+        if self.queue is None:
+            fn(*args)
+        else:
+            self.queue.put((fn, args))
+
+    def flush(self):
+        """ Wait until every submitted output is written """
+        if self.queue is not None:
+            self.queue.join()
+        self._raise()
+
+    def close(self):
+        """ Flush and stop the writer thread """
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        self._raise()
@@ -1,7 +1,8 @@
 # visualization.py
 
-from config import CTY_KEY, NUM_AGENTS, COLORBAR_NUM_INTERVALS, DPI, T_MAX_RANGE, PLOT_FOLIUM, ZIP_URLS
-from helper import FIGURE_PKL_CACHE_DIR, PLT_DIR, FOLIUM_DIR
+from config import COLORBAR_NUM_INTERVALS, DPI, T_MAX_RANGE, PLOT_FOLIUM, ZIP_URLS
+from helper import FIGURE_PKL_CACHE_DIR, PLT_DIR, FOLIUM_DIR, figure_key
+from snapshot import snapshot_path, load_snapshot
 from gdf_handler import load_gdf
 from graph_handler import load_graph
 import matplotlib.pyplot as plt
@@ -15,28 +16,25 @@ from pathlib import Path
 from branca.colormap import linear
 import osmnx as ox
 import numpy as np
-import pickle
 
 # =============================
 # VISUALIZATION EXECUTION LOGIC
 # =============================
 
-def plot_city(rho, alpha, t_max, centroids):
+def plot_city(rho, alpha, t_max, centroids, seed=None):
     """ Main plot function """
     # Define graph title, file name, and file path
-    figkey = f"{CTY_KEY}_{rho}_{alpha}_{NUM_AGENTS}_{t_max}"
+    figkey = figure_key(rho, alpha, t_max, seed)
     title = f"Timestep: {t_max}"
-    pickle_filename = f"{figkey}.pkl"
-    pickle_path = FIGURE_PKL_CACHE_DIR / pickle_filename
+    snapshot_file = snapshot_path(FIGURE_PKL_CACHE_DIR, figkey)
     
     # Don't pass large items as parameters - avoid pickling issues during multiprocessing (too big)
     gdf, _, _ = load_gdf()
     g = load_graph(ZIP_URLS)
     
     # Graphing logic
-    if pickle_path.exists():
-        with open(pickle_path, 'rb') as file:
-            city = pickle.load(file)
+    if snapshot_file.exists():
+        city = load_snapshot(snapshot_file)
             
         # Retrieve city data for plotting:
         df_data = city.get_data()
@@ -69,7 +67,7 @@ def plot_city(rho, alpha, t_max, centroids):
                 gdf=gdf
             )
     else:
-        print(f"Pickle file '{pickle_filename}' does not exist. Skipping plotting.")
+        print(f"Snapshot file '{snapshot_file.name}' does not exist. Skipping plotting.")
     
 
 # ================
@@ -146,7 +144,7 @@ def plot_matplotlib(centroids, city, title, figkey='city', graph=None, gdf=None)
     for ID in range(len(centroids)):
         lon = city.lon_array[ID]
         lat = city.lat_array[ID]
-        inhabitants = len(city.inh_array[ID])
+        inhabitants = city.pop_array[ID]
         ax.text(lon, lat, str(inhabitants), fontsize=9, ha='center', va='center', color='black')
         
     # Use the global ScalarMappable for consistent colorbar
@@ -222,7 +220,7 @@ def plot_folium(centroids, city, title, figkey='city', graph=None, gdf = None):
         # name
         name = city.name_array[i]
         # pop
-        inhabitants = len(city.inh_array[i])
+        inhabitants = city.pop_array[i]
         # amenity density
         amenity_density = city.amts_dens[i]
         # num amenities